@@ -0,0 +1,124 @@
+"""
+Micro benchmark for asset selection of ExtractSuite.
+
+Classifies a corpus of real AppImage release asset names for
+every host arch, checks results against expected ones and
+reports time per asset name. Exits with 1 if any name is
+classified wrong or selection got slower than --max-us.
+
+Usage:
+    python benchmarks/asset_selection.py
+"""
+
+import os
+import sys
+import timeit
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from aptod.extract_suite import is_compatible_asset, _incompatible_arch_pattern  # noqa: E402
+
+
+# Asset name -> arch it's built for (None means no arch in name)
+CORPUS = {
+    'tutanota-desktop-linux.AppImage': None,
+    'VSCodium-1.84.2.23317.glibc2.17-x86_64.AppImage': 'x86_64',
+    'VSCodium-1.84.2.23317.glibc2.17-aarch64.AppImage': 'aarch64',
+    'VSCodium-1.84.2.23317.glibc2.17-armv7l.AppImage': None,
+    'Bitwarden-2023.10.1-x86_64.AppImage': 'x86_64',
+    'Insomnia.Core-8.4.2.AppImage': None,
+    'Linux.Pulsar-1.111.0.AppImage': None,
+    'ARM.Linux.Pulsar-1.111.0-arm64.AppImage': 'aarch64',
+    'KeePassXC-2.7.6-x86_64.AppImage': 'x86_64',
+    'KeePassXC-2.7.6-aarch64.AppImage': 'aarch64',
+    'session-desktop-linux-x86_64-1.11.5.AppImage': 'x86_64',
+    'shotcut-linux-x86_64-231122.AppImage': 'x86_64',
+    'FreeCAD_0.21.1-Linux-x86_64.AppImage': 'x86_64',
+    'FreeCAD_weekly-2023.11.22-Linux-x86_64.AppImage': 'x86_64',
+    'Obsidian-1.4.16.AppImage': None,
+    'Obsidian-1.4.16-arm64.AppImage': 'aarch64',
+    'Joplin-2.13.6.AppImage': None,
+    'LibreWolf.x86_64.AppImage': 'x86_64',
+    'LibreWolf.aarch64.AppImage': 'aarch64',
+    'Nextcloud-3.10.2-x86_64.AppImage': 'x86_64',
+    'Kdenlive-23.08.3-x86_64.AppImage': 'x86_64',
+    'krita-5.2.1-x86_64.appimage': 'x86_64',
+    'Inkscape-c4e8f9e-x86_64.AppImage': 'x86_64',
+    'GIMP_AppImage-release-2.10.34-withplugins-x86_64.AppImage': 'x86_64',
+    'Audacity-3.4.2-20.04-x86_64.AppImage': 'x86_64',
+    'MuseScore-Studio-4.2.0.233521125-x86_64.AppImage': 'x86_64',
+    'MuseScore-4.1.1.232071203-aarch64.AppImage': 'aarch64',
+    'MuseScore-4.1.1.232071203-armv7l.AppImage': None,
+    'Zettlr-3.0.2-x86_64.AppImage': 'x86_64',
+    'Zettlr-3.0.2-arm64.AppImage': 'aarch64',
+    'Etcher-1.18.11-x64.AppImage': 'x86_64',
+    'balenaEtcher-1.18.11-ia32.AppImage': 'i386',
+    'Signal-desktop-6.40.0-amd64.AppImage': 'x86_64',
+    'qbittorrent-4.6.1_x86_64.AppImage': 'x86_64',
+    'Cura-5.5.0-linux-X64.AppImage': 'x86_64',
+    'UltiMaker-Cura-5.5.0-linux-modern.AppImage': None,
+    'PrusaSlicer-2.6.1+linux-x64-GTK3-202309060801.AppImage': 'x86_64',
+    'OrcaSlicer_Linux_V1.8.1.AppImage': None,
+    'Logseq-linux-x64-0.10.1.AppImage': 'x86_64',
+    'Heroic-2.11.0.AppImage': None,
+    'Ryujinx-1.1.1100-x64.AppImage': 'x86_64',
+    'rpcs3-v0.0.29-15630-1e43a2d5_linux64.AppImage': 'x86_64',
+    'duckstation-x64.AppImage': 'x86_64',
+    'PCSX2-v1.7.5245.AppImage': None,
+    'appimagetool-i686.AppImage': 'i386',
+    'appimagetool-armhf.AppImage': 'armv7hl',
+    'appimagetool-aarch64.AppImage': 'aarch64',
+    'appimagetool-x86_64.AppImage': 'x86_64',
+    'pcloud-x86.AppImage': 'i386',
+    'Arduino-IDE_2.2.1_Linux_64bit.AppImage': 'x86_64',
+    'Arduino-IDE_2.2.1_Linux_ARM32.AppImage': 'armv7hl',
+    'Kiwix-2.3.1-i386.AppImage': 'i386',
+    'Artisan-2.8.4-x86_64.AppImage': 'x86_64',
+    'Auryo-2.5.4.AppImage': None,
+    'gameimage-1.4.0-x86_64.AppImage': 'x86_64',
+}
+
+HOSTS = ('x86_64', 'aarch64', 'armv7hl', 'i386')
+
+
+def expected(host: str, arch) -> bool:
+    """Compatible if name has no arch or has host's arch group."""
+    if arch is None:
+        return True
+    groups = {
+        'x86_64': ('x86_64',), 'aarch64': ('aarch64',),
+        'armv7hl': ('armv7hl',), 'i386': ('i386', 'i686'),
+    }
+    return host in groups[arch]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Asset selection micro benchmark.')
+    parser.add_argument('--number', type=int, default=200)
+    parser.add_argument('--max-us', type=float, default=5.0,
+                        help='Fail if one classification takes longer (microseconds).')
+    args = parser.parse_args()
+
+    failed = False
+    for host in HOSTS:
+        print(f'{host:<10}{_incompatible_arch_pattern(host).pattern}')
+        for name, arch in CORPUS.items():
+            result = is_compatible_asset(name, host)
+            if result != expected(host, arch):
+                print(f'WRONG on {host}: {name} -> {result}')
+                failed = True
+
+        names = list(CORPUS)
+        seconds = timeit.timeit(
+            lambda: [is_compatible_asset(name, host) for name in names], number=args.number)
+        per_name = seconds / (args.number * len(names)) * 1e6
+        status = '  TOO SLOW' if per_name > args.max_us else ''
+        failed = failed or bool(status)
+        print(f'{host:<10}{per_name:8.3f} us/asset{status}')
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
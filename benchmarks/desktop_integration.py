@@ -0,0 +1,169 @@
+"""
+Desktop integration benchmark.
+
+Installs hundreds of fake apps into a throwaway HOME and updates all
+of them, once with the old per app integration (chmod through shell,
+.desktop always rewritten, caches refreshed after every app) and once
+with a DesktopBatch (os.chmod, files written only when they change,
+caches refreshed once). A second batched run over unchanged apps
+must write nothing. If update-desktop-database or gtk-update-icon-cache
+isn't installed, a no-op stand-in is put on PATH, so process starts
+are still counted. Exits with 1 if batched update isn't faster or
+unchanged run writes files.
+
+Usage:
+    python benchmarks/desktop_integration.py --apps 500
+"""
+
+import os
+import re
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+SVG = b'<svg xmlns="http://www.w3.org/2000/svg" width="16" height="16"><rect width="16" height="16"/></svg>'
+TOOLS = ('update-desktop-database', 'gtk-update-icon-cache')
+
+
+def stub_tools(bin_dir: str) -> list:
+    """No-op stand-ins of missing cache tools."""
+    stubbed = []
+    os.makedirs(bin_dir, exist_ok=True)
+    for tool in TOOLS:
+        if shutil.which(tool):
+            continue
+        path = os.path.join(bin_dir, tool)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write('#!/bin/sh\nexit 0\n')
+        os.chmod(path, 0o755)
+        stubbed.append(tool)
+    os.environ['PATH'] = bin_dir + os.pathsep + os.environ['PATH']
+    return stubbed
+
+
+def make_apps(main_folder: str, count: int, version: str) -> list:
+    """Fake AppImages (not executable yet) and their app_data."""
+    from aptod.utils import IconHandler
+
+    cache_dir = IconHandler().icon_cache_dir
+    os.makedirs(cache_dir, exist_ok=True)
+    apps = []
+    for index in range(count):
+        down_path = os.path.join(main_folder, f'App{index}')
+        os.makedirs(down_path, exist_ok=True)
+        for old in os.listdir(down_path):
+            os.remove(os.path.join(down_path, old))
+        name = f'App{index}-{version}-x86_64.AppImage'
+        with open(os.path.join(down_path, name), 'wb') as file:
+            file.write(b'\0' * 64)
+        # Cached icon, so no network is needed
+        with open(os.path.join(cache_dir, f'app{index}.icon'), 'wb') as file:
+            file.write(SVG)
+        apps.append({'name': name, 'app_down_path': down_path})
+    return apps
+
+
+def legacy_integration(app_data: dict) -> None:
+    """create_desktop before DesktopBatch, with a cache refresh per app
+    like a caller that refreshes caches after each install would do."""
+    from aptod.file_suite import FileSuite, DesktopBatch, applications_dir
+    from aptod.utils import IconHandler
+
+    example_dot = """[Desktop Entry]
+            Encoding=UTF-8
+            Type=Application
+            Terminal=false
+            Exec={app_path}
+            Name={app_name}
+            Icon={app_icon_path}"""
+
+    app_full_path = os.path.join(app_data['app_down_path'], app_data['name'])
+    os.system(f'chmod +x {app_full_path}')
+    path = applications_dir() + '/'
+    os.makedirs(path, exist_ok=True)
+    app_name = FileSuite.desktop_name(app_data['name'])
+    desktop_path = f'{path}{app_name}.desktop'
+    icon_name, _ = IconHandler().install_icon(app_name)
+
+    if not os.path.exists(desktop_path):
+        example_dot = example_dot.replace('{app_path}', app_full_path)
+        example_dot = example_dot.replace('{app_name}', re.findall(r'\w+', app_data['name'])[0])
+        example_dot = example_dot.replace('{app_icon_path}', icon_name)
+        with open(desktop_path, 'w', encoding="utf-8") as file:
+            file.write(example_dot)
+    else:
+        with open(desktop_path, 'r', encoding="utf-8") as file:
+            desktop_f = file.read()
+        first_word = re.findall(r'\w+', app_data['name'])[0]
+        to_replace = re.search(f'{first_word}(.*).AppImage', desktop_f).group()
+        if '/' in to_replace:
+            to_replace = to_replace.split('/')[-1]
+        desktop_f = desktop_f.replace(to_replace, app_data['name'])
+        with open(desktop_path, 'w', encoding="utf-8") as file:
+            file.write(desktop_f)
+
+    batch = DesktopBatch()
+    batch.desktop_changed()
+    batch.flush()
+
+
+def batched(apps: list):
+    """Time of integrating apps in one batch, and the batch."""
+    from aptod.file_suite import FileSuite, DesktopBatch
+
+    file_suite = FileSuite()
+    start = time.perf_counter()
+    with DesktopBatch() as batch:
+        for app_data in apps:
+            file_suite.create_desktop(app_data, batch)
+    return (time.perf_counter() - start) * 1000, batch
+
+
+def legacy(apps: list) -> float:
+    start = time.perf_counter()
+    for app_data in apps:
+        legacy_integration(app_data)
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Desktop integration benchmark.')
+    parser.add_argument('--apps', type=int, default=300, help='Number of .desktop entries.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as home:
+        os.environ['HOME'] = home
+        os.environ.pop('XDG_DATA_HOME', None)
+        os.environ.pop('XDG_CACHE_HOME', None)
+        stubbed = stub_tools(os.path.join(home, 'bin'))
+        main_folder = os.path.join(home, 'appImage')
+
+        # Same starting point for both, entries and icons of 1.0 exist
+        batched(make_apps(main_folder, args.apps, '1.0'))
+        legacy_ms = legacy(make_apps(main_folder, args.apps, '1.1'))
+
+        batched(make_apps(main_folder, args.apps, '1.0'))
+        apps = make_apps(main_folder, args.apps, '1.1')
+        batched_ms, batch = batched(apps)
+        unchanged_ms, unchanged = batched(apps)
+
+    print(f'{args.apps} apps' + (f', stand-in {" and ".join(stubbed)}' if stubbed else ''))
+    print(f"{'':<22}{'ms':>10}{'ms/app':>10}{'writes':>8}{'refreshes':>11}")
+    print(f"{'legacy update':<22}{legacy_ms:>10.1f}{legacy_ms / args.apps:>10.2f}"
+          f"{args.apps:>8}{args.apps:>11}")
+    for label, elapsed, result in (('batched update', batched_ms, batch),
+                                   ('unchanged', unchanged_ms, unchanged)):
+        print(f"{label:<22}{elapsed:>10.1f}{elapsed / args.apps:>10.2f}"
+              f"{result.desktop_writes + result.icon_writes:>8}{result.refreshes:>11}")
+    print(f'Batched update is {legacy_ms / batched_ms:.1f}x faster.')
+
+    failed = batched_ms >= legacy_ms or unchanged.desktop_writes or unchanged.icon_writes
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
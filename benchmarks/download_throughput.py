@@ -0,0 +1,116 @@
+"""
+Download throughput benchmark.
+
+Serves a random file from a local HTTP server (in its own process)
+and downloads it with the old per-KB write loop and with downloader().
+Both compute SHA-256, so only the write path differs. Reports MB/s
+and CPU time of downloading process. Exits with 1 if downloader()
+isn't faster than old loop.
+
+Usage:
+    python benchmarks/download_throughput.py --size 256
+"""
+
+import os
+import sys
+import time
+import hashlib
+import argparse
+import resource
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+from aptod.utils import downloader, http_client, segmented  # noqa: E402
+
+SERVER = '''
+import os, sys, http.server
+DATA = os.urandom(int(sys.argv[2]) * 1024 * 1024)
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(len(DATA)))
+        self.end_headers()
+        view = memoryview(DATA)
+        for start in range(0, len(DATA), 1024 * 1024):
+            self.wfile.write(view[start:start + 1024 * 1024])
+    def log_message(self, *args):
+        pass
+server = http.server.ThreadingHTTPServer(('127.0.0.1', int(sys.argv[1])), Handler)
+print('ready', flush=True)
+server.serve_forever()
+'''
+
+
+def old_loop(url: str, path: str) -> None:
+    """Write loop of downloader before adaptive writer."""
+    res = http_client.get(url, stream=True)
+    res.raise_for_status()
+    sha256 = hashlib.sha256()
+    done = 0
+    with open(path, 'ab') as file:
+        for chunk in res.iter_content(chunk_size=1024):
+            if chunk:
+                file.write(chunk)
+                file.flush()
+                sha256.update(chunk)
+                # Progress bar ticked for every chunk
+                done += len(chunk)
+
+
+def new_writer(url: str, path: str) -> None:
+    app_data = {'name': os.path.basename(path), 'down_url': url, 'app_down_path': os.path.dirname(path)}
+    downloader(app_data, on_progress=lambda done, total: None)
+
+
+def measure(func, url: str, directory: str, size_mb: int) -> dict:
+    path = os.path.join(directory, f'{func.__name__}.AppImage')
+    before = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+    func(url, path)
+    wall = time.perf_counter() - start
+    after = resource.getrusage(resource.RUSAGE_SELF)
+    os.remove(path)
+
+    cpu = (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+    return {'mb_s': size_mb / wall, 'cpu_s': cpu, 'cpu_pct': cpu / wall * 100}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Download throughput benchmark.')
+    parser.add_argument('--size', type=int, default=256, help='File size in MB.')
+    parser.add_argument('--port', type=int, default=8791)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    # Single connection, segmented downloads are another benchmark
+    segmented.configure(connections=1)
+    server = subprocess.Popen(
+        [sys.executable, '-c', SERVER, str(args.port), str(args.size)],
+        stdout=subprocess.PIPE, text=True)
+    try:
+        server.stdout.readline()
+        url = f'http://127.0.0.1:{args.port}/app.AppImage'
+        results = {}
+        with tempfile.TemporaryDirectory() as directory:
+            for func in (old_loop, new_writer):
+                runs = [measure(func, url, directory, args.size) for _ in range(args.repeat)]
+                results[func.__name__] = max(runs, key=lambda run: run['mb_s'])
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(f"{'writer':<12}{'MB/s':>10}{'CPU s':>10}{'CPU %':>10}")
+    for name, result in results.items():
+        print(f"{name:<12}{result['mb_s']:>10.1f}{result['cpu_s']:>10.2f}{result['cpu_pct']:>10.1f}")
+    speedup = results['new_writer']['mb_s'] / results['old_loop']['mb_s']
+    print(f'Speedup: {speedup:.1f}x')
+
+    sys.exit(0 if speedup > 1 else 1)
+
+
+if __name__ == '__main__':
+    main()
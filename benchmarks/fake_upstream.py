@@ -0,0 +1,258 @@
+"""
+Local stand-in for Github, Gitlab, release downloads and appimage.github.io.
+
+Serves every app of given app map (source -> app name) with generated
+releases, so Aptod can be benchmarked without network. Api answers
+have ETags and rate limit headers like real ones, downloads support
+Range requests and can be slowed with latency and bandwidth limits.
+
+Routes:
+    /github/repos/<owner>/<repo>/releases[/latest]   Github REST api
+    /gitlab/projects/<id>/releases/                   Gitlab api
+    /download/<source>/<version>/<file>               release assets
+    /apps                                             appimage.github.io catalog
+    /icons/<name>.png                                 catalog icons
+
+Usage:
+    python benchmarks/fake_upstream.py --port 8790 --app-map apps.json
+"""
+
+import re
+import sys
+import json
+import time
+import zlib
+import struct
+import hashlib
+import argparse
+import threading
+import http.server
+from urllib.parse import urlparse, parse_qs
+
+
+def make_png(width: int = 64, height: int = 64) -> bytes:
+    """Plain blue PNG, without PIL."""
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    row = b'\x00' + b'\x14\x5d\xa0' * width
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(row * height))
+            + chunk(b'IEND', b''))
+
+
+class Upstream:
+    """Generated releases of every app, shared by request handlers."""
+
+    def __init__(self, app_map: dict, base_url: str, args):
+        self.app_map = app_map
+        self.base_url = base_url
+        self.releases = args.releases
+        self.latency = args.latency / 1000
+        self.bandwidth = args.bandwidth * 1024 * 1024
+        # Same bytes for every asset, only the names differ
+        self.asset = bytes(hashlib.sha256(str(i).encode()).digest()[0] for i in range(256)) * (
+            args.asset_size * 1024 * 1024 // 256)
+        self.asset_digest = 'sha256:' + hashlib.sha256(self.asset).hexdigest()
+        self.icon = make_png()
+        self.rate_reset = int(time.time()) + 3600
+        self.rate_used = 0
+        self.lock = threading.Lock()
+
+    def rate_headers(self) -> dict:
+        with self.lock:
+            self.rate_used += 1
+            used = self.rate_used
+        return {
+            'X-RateLimit-Limit': '5000',
+            'X-RateLimit-Remaining': str(max(0, 5000 - used)),
+            'X-RateLimit-Reset': str(self.rate_reset),
+            'X-RateLimit-Resource': 'core',
+        }
+
+    def asset_url(self, source: str, version: str, file_name: str) -> str:
+        return f'{self.base_url}/download/{source}/{version}/{file_name}'
+
+    def github_release(self, owner: str, repo: str, index: int) -> dict:
+        """index 0 is latest release."""
+        name = self.app_map.get(f'github:{owner}/{repo}'.lower(), repo)
+        version = f'{self.releases - index}.0.0'
+        tag = f'v{version}'
+        assets = []
+        for arch in ('x86_64', 'aarch64'):
+            file_name = f'{name}-{version}-{arch}.AppImage'
+            assets.append({
+                'name': file_name,
+                'browser_download_url': self.asset_url(f'{owner}/{repo}', tag, file_name),
+                'size': len(self.asset),
+                'digest': self.asset_digest,
+            })
+        assets.append({
+            'name': f'{name}-{version}.tar.gz',
+            'browser_download_url': self.asset_url(f'{owner}/{repo}', tag, f'{name}-{version}.tar.gz'),
+            'size': 1024,
+        })
+        return {
+            'tag_name': tag,
+            'prerelease': False,
+            'published_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(time.time() - index * 86400)),
+            'body': 'Release notes. ' * 200,
+            'assets': assets,
+        }
+
+    def gitlab_release(self, project_id: str, index: int) -> dict:
+        name = self.app_map.get(f'gitlab:{project_id}', f'project{project_id}')
+        version = f'{self.releases - index}.0.0'
+        links = [
+            {'name': f'{name}-{version}-{arch}.AppImage',
+             'url': self.asset_url(project_id, version, f'{name}-{version}-{arch}.AppImage')}
+            for arch in ('x86_64', 'aarch64')
+        ]
+        return {'tag_name': version, 'released_at': '', 'assets': {'links': links}}
+
+    def catalog_page(self) -> str:
+        rows = ''.join(
+            f'<tr><td><a href="/{name}"><img src="{self.base_url}/icons/{name}.png">{name}</a></td></tr>'
+            for name in sorted(set(self.app_map.values())))
+        return f'<html><body><table><tbody>{rows}</tbody></table></body></html>'
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    upstream: Upstream = None
+
+    def log_message(self, *args):
+        pass
+
+    def send_body(self, body: bytes, content_type: str, headers: dict = None) -> None:
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, data, headers: dict = None) -> None:
+        self.send_body(json.dumps(data).encode(), 'application/json', headers)
+
+    def do_GET(self):
+        upstream = self.upstream
+        if upstream.latency:
+            time.sleep(upstream.latency)
+
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+
+        match = re.match(r'^/github/repos/([^/]+)/([^/]+)/releases(/latest)?/?$', url.path)
+        if match:
+            owner, repo, latest = match.groups()
+            headers = upstream.rate_headers()
+            if latest:
+                return self.send_json(upstream.github_release(owner, repo, 0), headers)
+            per_page = min(100, int(query.get('per_page', ['30'])[0]))
+            page = int(query.get('page', ['1'])[0])
+            start = (page - 1) * per_page
+            end = min(start + per_page, upstream.releases)
+            if end < upstream.releases:
+                next_url = (f'{upstream.base_url}/github/repos/{owner}/{repo}/releases'
+                            f'?per_page={per_page}&page={page + 1}')
+                headers['Link'] = f'<{next_url}>; rel="next"'
+            return self.send_json(
+                [upstream.github_release(owner, repo, index) for index in range(start, end)], headers)
+
+        match = re.match(r'^/gitlab/projects/([^/]+)/releases/?$', url.path)
+        if match:
+            return self.send_json(
+                [upstream.gitlab_release(match.group(1), index) for index in range(upstream.releases)])
+
+        if url.path.startswith('/download/'):
+            return self.send_asset()
+
+        if url.path == '/apps':
+            return self.send_body(upstream.catalog_page().encode(), 'text/html')
+
+        if url.path.startswith('/icons/'):
+            return self.send_body(upstream.icon, 'image/png')
+
+        self.send_json({'message': 'Not Found'})
+
+    def do_POST(self):
+        # No GraphQL, Aptod falls back to REST
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(404)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def send_asset(self) -> None:
+        """Sends asset with Range support and bandwidth limit."""
+        data = self.upstream.asset
+        start, end = 0, len(data) - 1
+        match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if match:
+            start = int(match.group(1))
+            if match.group(2):
+                end = min(int(match.group(2)), end)
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(data)}')
+        else:
+            self.send_response(200)
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(end - start + 1))
+        self.end_headers()
+
+        view = memoryview(data)[start:end + 1]
+        chunk = 256 * 1024
+        began = time.monotonic()
+        try:
+            for offset in range(0, len(view), chunk):
+                self.wfile.write(view[offset:offset + chunk])
+                if self.upstream.bandwidth:
+                    # Sleep until sent bytes fit in the limit
+                    ahead = (offset + chunk) / self.upstream.bandwidth - (time.monotonic() - began)
+                    if ahead > 0:
+                        time.sleep(ahead)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local Github/Gitlab/catalog stand-in.')
+    parser.add_argument('--port', type=int, default=8790)
+    parser.add_argument('--app-map', required=True,
+                        help='Json file of source (github:owner/repo, gitlab:id) -> app name.')
+    parser.add_argument('--releases', type=int, default=3, help='Releases of each app.')
+    parser.add_argument('--asset-size', type=int, default=8, help='AppImage size in MB.')
+    parser.add_argument('--latency', type=float, default=0, help='Delay of every response in ms.')
+    parser.add_argument('--bandwidth', type=float, default=0,
+                        help='Download speed of each connection in MB/s, 0 is unlimited.')
+    args = parser.parse_args()
+
+    with open(args.app_map, 'r', encoding='utf-8') as file:
+        app_map = {key.lower(): value for key, value in json.load(file).items()}
+
+    Handler.upstream = Upstream(app_map, f'http://127.0.0.1:{args.port}', args)
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', args.port), Handler)
+    server.daemon_threads = True
+    print('ready', flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
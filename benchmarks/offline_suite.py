@@ -0,0 +1,259 @@
+"""
+Offline benchmark suite.
+
+Starts benchmarks/fake_upstream.py (local Github, Gitlab, download and
+appimage.github.io stand-in), points Aptod at it with aptod.conf in a
+throwaway HOME, and measures:
+
+    cold_start_ms          fresh `aptod --installed-apps` process
+    update_check_cold_ms   update check of whole catalog, empty http cache
+    update_check_warm_ms   same check again, answers are 304s
+    icon_pipeline_ms       catalog fetch and icons of every app
+    install_ms             pipelined install of --install apps
+    install_mb_s           download throughput of that install
+
+Results are written as json with the commit they were measured on.
+With --compare, metrics are compared with an older result and exits
+with 1 if any got worse than tolerance.
+
+Usage:
+    python benchmarks/offline_suite.py
+    python benchmarks/offline_suite.py --latency 50 --bandwidth 20 --compare old.json
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+import subprocess
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, 'src')
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+RUNNER = (
+    "import sys; sys.path.insert(0, {src!r}); sys.argv = ['aptod', *{args!r}]\n"
+    "from aptod.__main__ import main\n"
+    "try:\n    main()\nexcept SystemExit:\n    pass\n"
+)
+
+
+def git_commit() -> str:
+    res = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                         cwd=ROOT, capture_output=True, text=True, check=False)
+    return res.stdout.strip() or 'unknown'
+
+
+def app_map() -> dict:
+    """Source -> app name of every registry app, for fake server."""
+    from aptod.registry_suite import RegistrySuite
+
+    registry = RegistrySuite()
+    sources = {}
+    for app in registry.names():
+        source = registry.source(app)
+        if source['type'] == 'github':
+            sources[f"github:{source['owner']}/{source['repo']}"] = app
+        elif source['type'] == 'gitlab':
+            sources[f"gitlab:{source['projectId']}"] = app
+    return sources
+
+
+def write_config(home: str, main_folder: str, base_url: str) -> None:
+    cfg_dir = os.path.join(home, '.config', 'aptod')
+    os.makedirs(cfg_dir, exist_ok=True)
+    os.makedirs(main_folder, exist_ok=True)
+    with open(os.path.join(cfg_dir, 'aptod.conf'), 'w', encoding='utf-8') as file:
+        json.dump({
+            'MainFolder': main_folder,
+            'GithubApiUrl': f'{base_url}/github',
+            'GitlabApiUrl': f'{base_url}/gitlab',
+            'IconCatalogUrl': base_url,
+        }, file, indent=2)
+
+
+def fake_install(main_folder: str, apps: list) -> None:
+    """Old version of every app, so update check finds updates."""
+    for app in apps:
+        os.makedirs(os.path.join(main_folder, app), exist_ok=True)
+        with open(os.path.join(main_folder, app, f'{app}-1.0.0-x86_64.AppImage'), 'wb') as file:
+            file.write(b'\0' * 1024)
+
+
+def cold_start(home: str, repeat: int) -> float:
+    """Median wall time of fresh aptod processes, first run not counted."""
+    code = RUNNER.format(src=SRC, args=['--installed-apps'])
+    env = {**os.environ, 'HOME': home}
+    runs = []
+    for _ in range(repeat + 1):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], env=env, cwd=home,
+                       capture_output=True, check=False)
+        runs.append((time.perf_counter() - start) * 1000)
+    return statistics.median(runs[1:])
+
+
+def update_check(apps: list, jobs: int) -> tuple:
+    """Time of one update check of apps, and number of updates found."""
+    from aptod.aptod import Aptod
+
+    aptod = Aptod()
+    installed = aptod.installed_apps()
+    start = time.perf_counter()
+    results = aptod.check_updates(apps, installed, jobs)
+    elapsed = (time.perf_counter() - start) * 1000
+    errors = [data['Error'] for data in results.values() if data.get('Error')]
+    if errors:
+        raise RuntimeError(f'Update check failed: {errors[0]}')
+    return elapsed, sum(1 for data in results.values() if data)
+
+
+def icon_pipeline(apps: list) -> float:
+    """Catalog fetch and parse, and icon of every app."""
+    from aptod.utils import IconHandler
+
+    # Catalog is loaded once per process, start from nothing
+    IconHandler._catalog = None
+    IconHandler._index, IconHandler._matches = {}, {}
+    handler = IconHandler()
+    if os.path.exists(handler.catalog_pth):
+        os.remove(handler.catalog_pth)
+
+    start = time.perf_counter()
+    for app in apps:
+        handler.get_icon(app)
+    return (time.perf_counter() - start) * 1000
+
+
+def install(apps: list, jobs: int) -> float:
+    from aptod.aptod import Aptod
+
+    start = time.perf_counter()
+    # Progress bars are not part of result
+    with contextlib.redirect_stdout(io.StringIO()):
+        Aptod().install_apps(apps, jobs)
+    return (time.perf_counter() - start) * 1000
+
+
+def run(args, home: str) -> dict:
+    main_folder = os.path.join(home, 'appImage')
+    base_url = f'http://127.0.0.1:{args.port}'
+    write_config(home, main_folder, base_url)
+
+    apps = app_map()
+    map_pth = os.path.join(home, 'app_map.json')
+    with open(map_pth, 'w', encoding='utf-8') as file:
+        json.dump(apps, file)
+    names = sorted(apps.values())
+    fake_install(main_folder, names)
+
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'benchmarks', 'fake_upstream.py'),
+         '--port', str(args.port), '--app-map', map_pth,
+         '--asset-size', str(args.asset_size), '--latency', str(args.latency),
+         '--bandwidth', str(args.bandwidth)],
+        stdout=subprocess.PIPE, text=True)
+    try:
+        server.stdout.readline()
+
+        # Same settings with cli
+        from aptod.file_suite import FileSuite
+        from aptod.utils import http_client, icon_handler
+        from aptod.extract_suite import configure as configure_extract
+
+        config = FileSuite().get_config()
+        http_client.configure(pool_maxsize=max(16, args.jobs))
+        configure_extract(github_api=config['GithubApiUrl'], gitlab_api=config['GitlabApiUrl'])
+        icon_handler.configure(catalog_url=config['IconCatalogUrl'])
+
+        results = {'cold_start_ms': cold_start(home, args.repeat)}
+        results['update_check_cold_ms'], updates = update_check(names, args.jobs)
+        results['update_check_warm_ms'], _ = update_check(names, args.jobs)
+        results['updates_found'] = updates
+        results['icon_pipeline_ms'] = icon_pipeline(names)
+
+        # Fresh folder, so apps are really installed
+        install_folder = os.path.join(home, 'installs', 'appImage')
+        write_config(home, install_folder, base_url)
+        installs = names[:args.install]
+        results['install_ms'] = install(installs, args.jobs)
+        results['install_mb_s'] = len(installs) * args.asset_size / (results['install_ms'] / 1000)
+    finally:
+        server.terminate()
+        server.wait()
+
+    return {key: round(value, 2) for key, value in results.items()}
+
+
+def compare(results: dict, old: dict, tolerance: float) -> bool:
+    """Prints results next to old ones. Returns True if something got worse."""
+    failed = False
+    print(f"{'metric':<24}{'now':>12}{'before':>12}{'change':>10}")
+    for name, value in results.items():
+        before = old.get(name)
+        change, status = '-', ''
+        if before:
+            ratio = value / before
+            change = f'{(ratio - 1) * 100:+.0f}%'
+            # Times should go down, throughput up
+            if name.endswith('_ms') and ratio > 1 + tolerance:
+                status, failed = '  REGRESSION', True
+            elif name.endswith('_mb_s') and ratio < 1 - tolerance:
+                status, failed = '  REGRESSION', True
+        print(f"{name:<24}{value:>12}{before if before is not None else '-':>12}{change:>10}{status}")
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Aptod offline benchmark suite.')
+    parser.add_argument('--port', type=int, default=8790)
+    parser.add_argument('--jobs', type=int, default=4)
+    parser.add_argument('--install', type=int, default=5, help='Number of apps to install.')
+    parser.add_argument('--asset-size', type=int, default=8, help='AppImage size in MB.')
+    parser.add_argument('--latency', type=float, default=20, help='Delay of every response in ms.')
+    parser.add_argument('--bandwidth', type=float, default=0,
+                        help='Download speed of each connection in MB/s, 0 is unlimited.')
+    parser.add_argument('--repeat', type=int, default=3, help='Cold start runs.')
+    parser.add_argument('--output', help='Result json path (default benchmarks/results/<commit>.json).')
+    parser.add_argument('--compare', metavar='PATH', help='Older result json to compare with.')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed change ratio before a metric counts as regression.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as home:
+        # Aptod reads HOME on use, real config and caches are never touched
+        os.environ['HOME'] = home
+        os.environ.pop('GITHUB_TOKEN', None)
+        sys.path.insert(0, SRC)
+        results = run(args, home)
+
+    report = {
+        'commit': git_commit(),
+        'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'params': {key: getattr(args, key) for key in ('jobs', 'install', 'asset_size', 'latency', 'bandwidth')},
+        'results': results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{report['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2)
+
+    old = {}
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as file:
+            old_report = json.load(file)
+        if old_report.get('params') != report['params']:
+            print('Warning: results were measured with different parameters.')
+        old = old_report['results']
+    failed = compare(results, old, args.tolerance)
+    print(f'Results written to {output}')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
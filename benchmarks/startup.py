@@ -0,0 +1,165 @@
+"""
+Cold start benchmark for aptod cli.
+
+Runs each subcommand with `python -X importtime` in a fresh
+interpreter and a throwaway HOME, and reports import time of
+aptod and wall time of the whole run. Working tree is measured
+together with a git ref (checked out into a temp folder), runs of
+both alternate, so only their ratio matters and machine speed
+doesn't. Exits with 1 if any subcommand got slower than the ref
+(plus tolerance) or imported a heavy module it doesn't need.
+
+Usage:
+    python benchmarks/startup.py                        # compare with origin/main
+    python benchmarks/startup.py --against HEAD
+"""
+
+import os
+import re
+import sys
+import time
+import tarfile
+import argparse
+import tempfile
+import subprocess
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Subcommands that must not touch network or heavy dependencies.
+COMMANDS = {
+    'version': ['--version'],
+    'help': ['--help'],
+    'installed-apps': ['--installed-apps'],
+    'available-apps': ['--available-apps'],
+    'cache-stats': ['--cache-stats'],
+}
+
+HEAVY_MODULES = ('requests', 'PIL', 'matplotlib', 'bs4', 'cpuinfo', 'clint', 'simple_term_menu')
+
+RUNNER = (
+    "import sys; sys.path.insert(0, {src!r}); sys.argv = ['aptod', *{args!r}]\n"
+    "from aptod.__main__ import main\n"
+    "try:\n    main()\nexcept SystemExit:\n    pass\n"
+)
+
+IMPORT_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def merge_base(ref: str) -> str:
+    """Commit where HEAD forked from ref, so changes already committed
+    on a branch are measured too. Than ref is missing (exmp. no remote)
+    HEAD is used."""
+    res = subprocess.run(['git', 'merge-base', 'HEAD', ref], cwd=ROOT,
+                         capture_output=True, text=True, check=False)
+    if res.returncode:
+        print(f'{ref} not found, comparing with HEAD.')
+        return 'HEAD'
+    return res.stdout.strip()
+
+
+def checkout(ref: str, path: str) -> str:
+    """Extracts src folder of git ref into path, returns its src."""
+    archive = os.path.join(path, 'src.tar')
+    subprocess.run(['git', 'archive', '--format=tar', '-o', archive, ref, 'src'],
+                   cwd=ROOT, check=True)
+    with tarfile.open(archive) as tar:
+        # Newer pythons warn without a filter
+        tar.extractall(path, **({'filter': 'data'} if hasattr(tarfile, 'data_filter') else {}))
+    return os.path.join(path, 'src')
+
+
+def run_once(src: str, args: list, home: str) -> dict:
+    """Runs one cold start, returns timings in milliseconds
+    and imported module names."""
+    code = RUNNER.format(src=src, args=args)
+    env = {**os.environ, 'HOME': home}
+    start = time.perf_counter()
+    res = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        env=env, cwd=home, capture_output=True, text=True, check=False)
+    wall = (time.perf_counter() - start) * 1000
+
+    aptod_us = 0
+    modules = set()
+    for line in res.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if not match:
+            continue
+        cumulative, indent, name = int(match.group(2)), len(match.group(3)), match.group(4)
+        modules.add(name.split('.')[0])
+        # Top level imports of aptod package
+        if indent == 1 and name.startswith('aptod'):
+            aptod_us += cumulative
+
+    return {'import_ms': aptod_us / 1000, 'wall_ms': wall, 'modules': modules}
+
+
+def summary(runs: list) -> dict:
+    return {
+        'import_ms': round(statistics.median(r['import_ms'] for r in runs), 2),
+        'wall_ms': round(statistics.median(r['wall_ms'] for r in runs), 2),
+        'heavy': sorted(set(HEAVY_MODULES) & runs[0]['modules']),
+        'modules': runs[0]['modules'],
+    }
+
+
+def measure(sources: dict, repeat: int) -> dict:
+    """Median timings of every subcommand for every src folder.
+    Runs of sources alternate, so load changes hit all of them."""
+    results = {label: {} for label in sources}
+    # Both are measured with bytecode, even with PYTHONDONTWRITEBYTECODE
+    for src in sources.values():
+        subprocess.run([sys.executable, '-m', 'compileall', '-q', src], capture_output=True, check=False)
+    with tempfile.TemporaryDirectory() as home:
+        for name, args in COMMANDS.items():
+            runs = {label: [] for label in sources}
+            for label, src in sources.items():
+                # First run creates config files, not counted
+                run_once(src, args, home)
+            for _ in range(repeat):
+                for label, src in sources.items():
+                    runs[label].append(run_once(src, args, home))
+            for label in sources:
+                results[label][name] = summary(runs[label])
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Aptod cold start benchmark.')
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--against', default='origin/main', metavar='REF',
+                        help='Git ref whose merge base working tree is compared with (default origin/main).')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed slowdown ratio over ref (default 0.25, 25%%).')
+    args = parser.parse_args()
+
+    base = merge_base(args.against)
+    label = args.against if base != 'HEAD' else base
+    with tempfile.TemporaryDirectory() as tmp:
+        sources = {'ref': checkout(base, tmp), 'now': os.path.join(ROOT, 'src')}
+        results = measure(sources, args.repeat)
+
+    failed = False
+    print(f"{'command':<16}{'import ms':>12}{label[:12]:>12}{'ratio':>8}{'wall ms':>10}  heavy imports")
+    for name, result in results['now'].items():
+        base = results['ref'][name]
+        ratio = result['import_ms'] / base['import_ms'] if base['import_ms'] else 1.0
+        status = ''
+        if ratio > 1 + args.tolerance:
+            status = '  REGRESSION'
+            failed = True
+        if result['heavy']:
+            status += '  HEAVY IMPORT'
+            failed = True
+        new = sorted(result['modules'] - base['modules'])
+        if new:
+            status += f"  new imports: {', '.join(new)}"
+        print(f"{name:<16}{result['import_ms']:>12.2f}{base['import_ms']:>12.2f}{ratio:>8.2f}"
+              f"{result['wall_ms']:>10.2f}  {', '.join(result['heavy']) or '-'}{status}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -7,20 +7,30 @@ import re
 import time
 from collections import OrderedDict
 import argparse
-from simple_term_menu import TerminalMenu
 
-from .utils import downloader, is_valid_url
-from .extract_suite import ExtractSuite
+from .utils import downloader, is_valid_url, http_client, segmented, icon_handler, store
+from .utils.store import DownloadStore
+from .utils.appimage_info import appimage_info
+from .extract_suite import ExtractSuite, settings as extract_settings
+from .extract_suite import configure as configure_extract
 from .up_suite import UpSuite
-from .file_suite import FileSuite
+from .file_suite import FileSuite, DesktopBatch
+from .cache_suite import CacheSuite
+from .registry_suite import RegistrySuite
+from .rate_limit_suite import HIGH, NORMAL, BACKGROUND
 
 __version__ = "0.0.1"
 
 
-APP_LIST =  ExtractSuite().get('all')
+def get_app_list() -> list:
+    """Returns available app names, registry is built once
+    and rebuilt only if user repo changes."""
+    return RegistrySuite().names()
 
 def show_categories_menu():
     """Show download menu."""
+    from simple_term_menu import TerminalMenu
+
     unofficial_apps = FileSuite().get_repo(unofficial=True)
     categories = list(dict.fromkeys([_['categorie'] for _ in unofficial_apps]))
     
@@ -56,8 +66,10 @@ def show_categories_menu():
 
 def download_menu():
     """Show download menu."""
+    from simple_term_menu import TerminalMenu
+
     terminal_menu = TerminalMenu(
-        APP_LIST,
+        get_app_list(),
         multi_select=True,
         show_multi_select_hint=True,
         menu_cursor_style=("fg_green", "bold"),
@@ -69,6 +81,8 @@ def download_menu():
 
 def remove_menu():
     """Show remove menu."""
+    from simple_term_menu import TerminalMenu
+
     terminal_menu = TerminalMenu(
         Aptod().installed_apps(),
         multi_select=True,
@@ -85,7 +99,6 @@ class Aptod:
     def __init__(self):
         self.file_suite = FileSuite()
         self.update_suite = UpSuite()
-        self.apps = APP_LIST
 
         data = self.file_suite.get_config()
         if not data:
@@ -93,6 +106,11 @@ class Aptod:
             data = self.file_suite.get_config()
         self.main_folder = data['MainFolder']
 
+    @property
+    def apps(self) -> list:
+        """Available app names."""
+        return get_app_list()
+
     def install_aptod(self):
         """Create config file, exist config file means Aptod is installed."""
         # If config file exists, app is intalled.
@@ -102,42 +120,118 @@ class Aptod:
         self.file_suite.create_config()
 
 
-    def installed_apps(self):
-        """Returns installed app names as list."""
+    def _app_name_of(self, file_name: str, file_path: str = None) -> str:
+        """Converts appimage name to simple app name.
+        Exmp. tutanota-desktop-linux-3-106-5.appimage > tutanota
+        Update information inside file wins over its name. Unknown
+        apps that tell their Github repo are named by repo."""
+        registry = RegistrySuite()
+        update_info = appimage_info(file_path).get('update_info', {}) if file_path else {}
+        app = registry.match_update_info(update_info) or registry.match_file(file_name)
+        if not app and update_info.get('type') == 'github':
+            app = update_info['repo']
+        return app
+
+    def _scan_apps(self, apps_folder: str, known: dict) -> dict:
+        """Builds installed apps from files in apps folder. Metadata
+        of known apps is kept if their file didn't change."""
 
         # Get all appimage names in MainFolder
         installed_appimages = {}
-        apps_folder = self.file_suite.get_main_app_dir()
-
-        # If not appImage folder exist we will consider there is no app to update
-        if not os.path.exists(apps_folder):
-            return []
-
         for dir_ in os.listdir(apps_folder):
             # Requried for errors
-            if not os.path.isfile(dir_):
+            if os.path.isdir(os.path.join(apps_folder, dir_)):
                 for file in os.listdir(os.path.join(apps_folder, dir_)):
                     if file.lower().endswith('.appimage'):
                         installed_appimages[file] = apps_folder + '/' + dir_ + '/' + file
                         break
 
-        # Convert appimage names to simple app name
-        # Exmp. tutanota-desktop-linux-3-106-5.appimage > tutanota
-        # And create dictionary with three data, file_name, name, file_path
+        # And create dictionary with file_name, file_path and file metadata
         installed_apps = {}
-
         for file_name, file_path in installed_appimages.items():
-
-            for app in self.apps:
-                if (app.lower() in file_name.lower() or
-                    app.lower().replace('-', '') in file_name.lower()):
-                    installed_apps[app] = {
-                        'file_name': file_name,
-                        'file_path': file_path,
-                    }
-                    break
+            app = self._app_name_of(file_name, file_path)
+            if not app:
+                continue
+            stat = os.stat(file_path)
+            data = {
+                'file_name': file_name,
+                'file_path': file_path,
+                'size': stat.st_size,
+                'mtime': stat.st_mtime_ns,
+            }
+            old = known.get(app, {})
+            if (old.get('file_path'), old.get('size'), old.get('mtime')) == (
+                    file_path, stat.st_size, stat.st_mtime_ns):
+                data = {**old, **data}
+            installed_apps[app] = data
         return installed_apps
 
+    def installed_apps(self):
+        """Returns installed apps as dictionary of app name -> file
+        data, from manifest. Manifest is rebuilt only if apps
+        folder changed out of Aptod."""
+
+        apps_folder = self.file_suite.get_main_app_dir()
+
+        # If not appImage folder exist we will consider there is no app to update
+        if not os.path.exists(apps_folder):
+            return {}
+
+        index = self.file_suite.get_installed_index()
+        if not self.file_suite.is_index_fresh(index, apps_folder):
+            index['apps'] = self._scan_apps(apps_folder, index.get('apps', {}))
+            self.file_suite.save_installed_index(index['apps'], apps_folder)
+        return index['apps']
+
+    def record_install(self, app_data: dict) -> None:
+        """Adds installed or updated app with its release data to manifest.
+        Only its entry is changed, apps folder isn't scanned again."""
+        path = os.path.join(app_data['app_down_path'], app_data['name'])
+        app = self._app_name_of(app_data['name'], path)
+        if not app or not os.path.exists(path):
+            return
+
+        stat = os.stat(path)
+        data = {
+            'file_name': app_data['name'],
+            'file_path': path,
+            'version': app_data.get('version'),
+            'url': app_data.get('down_url'),
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'hash': app_data.get('sha256'),
+        }
+        self.file_suite.set_installed_app(
+            app, data, self.file_suite.get_main_app_dir(), app_data['app_down_path'])
+
+    def check_updates(self, app_list: list, installed: dict, jobs: int = 4, priority: int = NORMAL) -> dict:
+        """Resolves latest releases of given installed apps concurrently.
+        Returns app name -> app data (or error) in app_list order.
+        Checks that rate limit doesn't allow for priority are postponed."""
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.update_suite.extractor.priority = priority
+
+        def check(app):
+            if app not in installed:
+                return {'Error': f'{app} is not installed.'}
+            # Keep one app's failure away from the others
+            try:
+                return self.update_suite.has_update(installed[app]['file_path'])
+            except Exception as err:
+                return {'Error': f'Update check failed for {app}: {err}'}
+
+        # With a Github token whole list is resolved in one or two GraphQL requests
+        self.update_suite.extractor.prefetch([app for app in app_list if app in installed])
+
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+            futures = [executor.submit(check, app) for app in app_list]
+            results = {app: future.result() for app, future in zip(app_list, futures)}
+
+        # Stale answers are refreshed for next run, this one doesn't wait
+        self.update_suite.extractor.revalidate_stale()
+        return results
+
     def update_apps(self, **kwargs):
         """Update handler for installed apps."""
         installed = self.installed_apps()
@@ -147,22 +241,48 @@ class Aptod:
             return
         if kwargs.get('app_list'):
             app_list = kwargs.get('app_list')
-        for app in app_list:
-            app_path = installed[app]['file_path']
-            app_name = installed[app]['file_name']
-            app_data = self.update_suite.has_update(app_path)
+
+        # Network bound part runs in parallel, updates run one by one afterwards.
+        # Apps named by user goes before budget kept for them.
+        priority = HIGH if kwargs.get('app_list') else NORMAL
+        results = self.check_updates(list(app_list), installed, kwargs.get('jobs', 4), priority)
+        ages = self.update_suite.extractor.ages
+        for app, app_data in results.items():
+            checked = f' (checked {format_age(ages[app])} ago)' if app in ages else ''
             # If functions returns data, there is a update
-            if app_data.get('Error'):
-                print(f"{app_data['Error']}", end='\r')
+            if app_data.get('Postponed'):
+                print(f"⏳ {app}: {app_data['Error']}")
+            elif app_data.get('Error'):
+                print(f"{app_data['Error']}")
             elif app_data:
-                print(f'❌ {app} is old to date.')
-                if kwargs.get('operation') == 'update':
-                    app_data['app_down_path'] = app_path.replace(app_name, '')
-                    app_data['app_cur_path'] = app_path
-                    self.update_suite.update_app(app_data)
-                    self.file_suite.create_desktop(app_data)
+                print(f'❌ {app} is old to date.{checked}')
             else:
-                print(f'✅ {app} is up to date.')
+                print(f'✅ {app} is up to date.{checked}')
+
+        if kwargs.get('operation') != 'update':
+            return
+        if extract_settings['offline']:
+            if any(app_data and not app_data.get('Error') for app_data in results.values()):
+                print('Offline, updates are not downloaded.')
+            return
+
+        # Desktop and icon caches are refreshed once, after all updates
+        with DesktopBatch() as batch:
+            for app, app_data in results.items():
+                if not app_data or app_data.get('Error'):
+                    continue
+                self.apply_update(app, app_data, installed, batch)
+
+    def apply_update(self, app: str, app_data: dict, installed: dict, batch: DesktopBatch = None) -> None:
+        """Replaces installed app with new release in app_data."""
+        app_path = installed[app]['file_path']
+        app_name = installed[app]['file_name']
+        app_data['app_down_path'] = app_path.replace(app_name, '')
+        app_data['app_cur_path'] = app_path
+        self.file_suite.prefetch_icon(app_data)
+        self.update_suite.update_app(app_data)
+        self.file_suite.create_desktop(app_data, batch)
+        self.record_install(app_data)
 
     def install_app(self, app_name: list = [], app_data: dict = {}) -> None:
         """Installas apps, creates logos, desktop files for them."""
@@ -172,31 +292,94 @@ class Aptod:
                 print(app_data['Error'])
                 return
 
-            # Create folder with app name
-            # Make first letter capital
-            app = ''.join(re.findall(r'\w+', app_data['name'])[:2])
-            down_path = os.path.join(self.main_folder, app)
-            if not os.path.exists(down_path):
-                os.makedirs(down_path)
-            app_data['app_down_path'] = down_path
+            self._prepare_down_path(app_data)
             downloader(app_data)
-            # Create .desktop for integration
-            self.file_suite.create_desktop(app_data)
+            self._integrate(app_data)
 
         if not app_data:
-            app_data = ExtractSuite().get(app_name)
+            extractor = ExtractSuite()
+            extractor.priority = HIGH
+            app_data = extractor.get(app_name)
         
         installer(app_data)
 
+    def _prepare_down_path(self, app_data: dict) -> None:
+        """Creates app folder and sets app_down_path."""
+        # Create folder with app name
+        # Make first letter capital
+        app = ''.join(re.findall(r'\w+', app_data['name'])[:2])
+        down_path = os.path.join(self.main_folder, app)
+        if not os.path.exists(down_path):
+            os.makedirs(down_path)
+        app_data['app_down_path'] = down_path
+        self.file_suite.prefetch_icon(app_data)
+
+    def _integrate(self, app_data: dict, batch: DesktopBatch = None) -> None:
+        """Creates .desktop for integration and adds app to manifest."""
+        self.file_suite.create_desktop(app_data, batch)
+        self.record_install(app_data)
+
+    def install_apps(self, app_list: list, jobs: int = 4) -> None:
+        """Installs several apps at once. Release resolution, downloads
+        and desktop integration are pipelined, so next app is resolved
+        and previous one is integrated while an app downloads."""
+        from .utils.pipeline import Stage, StageError, MultiBar, run_pipeline, format_timings
+
+        extractor = ExtractSuite()
+        extractor.priority = HIGH
+        names = [app['url'] if isinstance(app, dict) else app for app in app_list]
+        extractor.prefetch(names)
+
+        # Items are (index, value), index tells which bar to move
+        def resolve(item):
+            index, app = item
+            app_data = extractor.get(app)
+            if not app_data:
+                raise StageError(f'No app has been found for {app}.')
+            if app_data.get('Error'):
+                raise StageError(app_data['Error'])
+            return index, app_data
+
+        def download(item):
+            index, app_data = item
+            self._prepare_down_path(app_data)
+            downloader(app_data, on_progress=lambda done, total: bars.update(index, done=done, total=total))
+            return item
+
+        def integrate(item):
+            self._integrate(item[1], batch)
+            return item
+
+        # Integration writes manifest, so it has one worker
+        stages = [
+            Stage('resolve', resolve, jobs),
+            Stage('download', download, min(jobs, 3)),
+            Stage('integrate', integrate, 1),
+        ]
+        # Desktop and icon caches are refreshed once, after last app
+        with MultiBar(names) as bars, DesktopBatch() as batch:
+            start = time.monotonic()
+            results, timings = run_pipeline(
+                list(enumerate(names)), stages,
+                on_stage=lambda index, stage: bars.update(index, stage=stage))
+            for index, (_, error) in enumerate(results):
+                bars.update(index, stage=f'failed: {error}' if error else 'installed')
+
+        print(format_timings(timings, time.monotonic() - start))
+
 
 
     def uninstall_app(self, app_list):
         """Removes installed appimage and its files (.desktop...)."""
         installed_apps = self.installed_apps()
+        if not installed_apps:
+            return
         for app in app_list:
             if app in installed_apps:
                 self.file_suite.remove_app_files(installed_apps[app]['file_path'])
-                print(f'App {installed_apps[app]} has been removed.')
+                print(f'App {app} has been removed.')
+                del installed_apps[app]
+        self.file_suite.save_installed_index(installed_apps, self.file_suite.get_main_app_dir())
 
     # Update function, checks update if there is update it will ask for update
     def uninstalled_update(self, files):
@@ -223,6 +406,43 @@ class Aptod:
                 has_update['app_cur_path'] = file_
                 UpSuite().update_app(app_data=has_update)
 
+def format_age(seconds: float) -> str:
+    """Short age text, exmp. 42s, 5m, 3h, 2d"""
+    for unit, size in (('d', 86400), ('h', 3600), ('m', 60)):
+        if seconds >= size:
+            return f'{int(seconds // size)}{unit}'
+    return f'{int(seconds)}s'
+
+
+def stored_release_note(app: str) -> str:
+    """Latest stored version and its age, for app listings."""
+    data, age = CacheSuite().get_release(app)
+    if data is None:
+        return ''
+    return f" (latest {data.get('version') or data.get('name')}, checked {format_age(age)} ago)"
+
+
+def revalidate(app_list: list) -> None:
+    """Refreshes stored release data of apps, runs in background."""
+    extractor = ExtractSuite()
+    extractor.priority = BACKGROUND
+    for app in app_list:
+        extractor.get(app)
+
+
+def show_cache_stats():
+    """Prints release api cache statistics."""
+    stats = CacheSuite().get_stats()
+    print('CACHE STATS:')
+    for title, key in (('This run', 'run'), ('All time', 'total')):
+        print(
+            f"{title}: {stats[key]['hits']} hits, {stats[key]['misses']} misses, "
+            f"{stats[key]['revalidations']} revalidations")
+    print(f"{stats['entries']} cached responses, {stats['size'] / 1024:.1f} KB on disk")
+    store_stats = DownloadStore().stats()
+    print(f"Download store: {store_stats['files']} files, {store_stats['size'] / 1024 ** 2:.1f} MB "
+          f"({store_stats['own_size'] / 1024 ** 2:.1f} MB not shared with installed apps)")
+
 def app_data_error_handler(app_data: dict, func) -> None:
     """Preventing code duplicate. Simple helper function for 
     outputing errors."""
@@ -256,6 +476,20 @@ def main():
                 return url
             raise argparse.ArgumentTypeError(f"url:{url} is not valid.")
 
+        def positive_int(value):
+            """Check value is a positive integer."""
+            if value.isdigit() and int(value) > 0:
+                return int(value)
+            raise argparse.ArgumentTypeError(f"{value} is not a positive integer.")
+
+        def duration(value):
+            """Check value is a duration like 90, 30s, 15m, 6h or 2d."""
+            units = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+            match = re.fullmatch(r'(\d+)([smhd]?)', value.strip().lower())
+            if match:
+                return int(match.group(1)) * units[match.group(2) or 's']
+            raise argparse.ArgumentTypeError(f"{value} is not a duration, exmp. 30m, 6h, 2d.")
+
         def is_installed(app_name):
             """If app is installed than raise."""
             if app_name in Aptod().installed_apps():
@@ -298,6 +532,10 @@ def main():
             '--add-repo', '-ar',
             help='Add new url repo.',
             type=is_valid_url_raise)
+        group.add_argument(
+            '--watch',
+            help='Keep running and check installed apps on their own schedule.',
+            action='store_true')
         group.add_argument(
             '--remove', '-rm',
             metavar='AppImage',
@@ -315,6 +553,37 @@ def main():
             metavar='File',
             help='AppImage file full path\'s for the update.',
             type=is_file)
+        parser.add_argument(
+            '--jobs', '-j',
+            metavar='N',
+            help='Number of apps to check for updates at the same time.',
+            type=positive_int,
+            default=4)
+        parser.add_argument(
+            '--connections', '-c',
+            metavar='N',
+            help='Number of connections used for downloading big AppImages.',
+            type=positive_int)
+        parser.add_argument(
+            '--cache-stats',
+            help='Show release api cache statistics.',
+            action='store_true')
+        parser.add_argument(
+            '--auto-update',
+            help='With --watch, install found updates automatically.',
+            action='store_true')
+        parser.add_argument(
+            '--offline',
+            help='Use only stored release data, never connect to network.',
+            action='store_true')
+        parser.add_argument(
+            '--max-age',
+            metavar='DURATION',
+            help='Use stored release data younger than DURATION (exmp. 6h), '
+                 'older data is refreshed in background.',
+            type=duration)
+        # Used by background refresh of --max-age
+        parser.add_argument('--revalidate', nargs='+', help=argparse.SUPPRESS)
         parser.add_argument(
             '--show-unofficial', '-su',
             help='Show apps from unofficial repos.',
@@ -322,6 +591,28 @@ def main():
 
         args = parser.parse_args()
 
+        # Optional network settings in aptod.conf, cli options wins
+        config = FileSuite().get_config()
+        pool_size = config.get('HttpPoolSize') or http_client.settings['pool_maxsize']
+        http_client.configure(
+            timeout=config.get('HttpTimeout'),
+            retries=config.get('HttpRetries'),
+            # Every update check worker needs its own pooled connection
+            pool_maxsize=max(pool_size, args.jobs))
+        segmented.configure(
+            connections=args.connections or config.get('DownloadConnections'))
+        configure_extract(offline=args.offline, max_age=args.max_age, **{
+            key: config[name] for key, name in
+            (('github_api', 'GithubApiUrl'), ('gitlab_api', 'GitlabApiUrl')) if config.get(name)})
+        icon_handler.configure(catalog_url=config.get('IconCatalogUrl'))
+        store.configure(
+            path=config.get('StorePath'),
+            max_size=config['StoreMaxSize'] * 1024 * 1024 if config.get('StoreMaxSize') is not None else None)
+
+        if args.revalidate:
+            revalidate(args.revalidate)
+            return
+
         if args.add_repo:
             if len(args.add_repo) > 0:
                 app_data = ExtractSuite().get(args.add_repo)
@@ -342,7 +633,10 @@ def main():
             if not app_list:
                 app_list = select_menu()
             
-            for app in app_list:
+            if len(app_list) > 1:
+                Aptod().install_apps(app_list, jobs=args.jobs)
+            elif app_list:
+                app = app_list[0]
                 # If its dict than its from show_categories_menu
                 if isinstance(app, dict):
                     app = app['url']
@@ -352,8 +646,10 @@ def main():
         elif args.installed_apps:
             print('MY APPS:')
             app_list = list(Aptod().installed_apps().keys())
+            show_stored = args.offline or args.max_age is not None
             for app in app_list:
-                print(f'{app_list.index(app) + 1}){app}')
+                note = stored_release_note(app) if show_stored else ''
+                print(f'{app_list.index(app) + 1}){app}{note}')
 
         # Download --download, -d
         elif isinstance(args.download, list):
@@ -377,18 +673,26 @@ def main():
         # --update, -u
         elif isinstance(args.update, list):
             if len(args.update) > 0:
-                Aptod().update_apps(app_list=args.update, operation='update')
+                Aptod().update_apps(
+                    app_list=args.update, operation='update', jobs=args.jobs)
             elif args.file:
                 Aptod().uninstalled_update(args.file)
             else:
                 # Check updates
-                Aptod().update_apps(operation='update')
+                Aptod().update_apps(operation='update', jobs=args.jobs)
+
+        # --watch
+        elif args.watch:
+            from .watch_suite import WatchSuite
+            WatchSuite(Aptod(), jobs=args.jobs, auto_update=args.auto_update).run()
 
         # --avaliable-apps, -aa
         elif args.available_apps:
             print('AVAILABLE APPIMAGES:')
-            for app in APP_LIST:
-                print(f'{APP_LIST.index(app) + 1}){app}')
+            show_stored = args.offline or args.max_age is not None
+            for index, app in enumerate(get_app_list()):
+                note = stored_release_note(app) if show_stored else ''
+                print(f'{index + 1}){app}{note}')
 
         # --remove -rm
         elif isinstance(args.remove, list):
@@ -399,8 +703,11 @@ def main():
             else:
                 print('Curretly you don\'t have any installed app.')
      
-        else:
+        elif not args.cache_stats:
             parser.print_help()
 
+        if args.cache_stats:
+            show_cache_stats()
+
     except KeyboardInterrupt:
         print('Keyboard interrupt, exiting.')
@@ -0,0 +1,216 @@
+"""
+Http response cache for release apis.
+Responses are revalidated with If-None-Match/If-Modified-Since,
+so unchanged releases cost a 304 instead of full json and rate limit.
+"""
+
+import os
+import json
+import time
+import atexit
+import threading
+from urllib.parse import urlencode
+
+from .file_suite import FileSuite
+from .utils import http_client
+
+
+class CachedResponse:
+    """Minimal response object returned by CacheSuite.get"""
+
+    def __init__(self, key: str, status_code: int, headers: dict, body, entry: dict = None):
+        self.key = key
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+        # Set when server answered 304 and body comes from disk
+        self.not_modified = entry is not None
+        self.selection = entry.get('selection') if entry else None
+
+    @property
+    def ok(self) -> bool:
+        return self.status_code < 400
+
+    def json(self):
+        return self.body
+
+
+class CacheSuite:
+    """Keeps ETag/Last-Modified, response body and chosen
+    appimage data of each requested api url on disk."""
+
+    # Shared by every instance, loaded once per process
+    _entries = None
+    _releases = None
+    _hints = None
+    _stats = None
+    _run_stats = {'hits': 0, 'misses': 0, 'revalidations': 0}
+    _lock = threading.RLock()
+    _dirty = False
+
+    def __init__(self):
+        self.cache_pth = os.path.join(FileSuite().cfg_dir, 'http_cache.json')
+        self._load()
+
+    def _load(self) -> None:
+        """Reads cache file, once."""
+        with self._lock:
+            if CacheSuite._entries is not None:
+                return
+
+            data = {}
+            if os.path.exists(self.cache_pth):
+                try:
+                    with open(self.cache_pth, 'r', encoding="utf-8") as file:
+                        data = json.load(file)
+                except (json.decoder.JSONDecodeError, OSError):
+                    # Broken cache is not important, start from zero
+                    data = {}
+
+            CacheSuite._entries = data.get('entries', {})
+            CacheSuite._releases = data.get('releases', {})
+            CacheSuite._hints = data.get('hints', {})
+            CacheSuite._stats = {
+                'hits': 0, 'misses': 0, 'revalidations': 0, **data.get('stats', {})}
+            atexit.register(self.save)
+
+    def save(self) -> None:
+        """Writes cache to disk if anything changed."""
+        with self._lock:
+            if not CacheSuite._dirty:
+                return
+
+            os.makedirs(os.path.dirname(self.cache_pth), exist_ok=True)
+            tmp_pth = self.cache_pth + '.tmp'
+            with open(tmp_pth, 'w', encoding="utf-8") as file:
+                json.dump({
+                    'entries': self._entries, 'releases': self._releases,
+                    'hints': self._hints, 'stats': self._stats,
+                }, file)
+            os.replace(tmp_pth, self.cache_pth)
+            CacheSuite._dirty = False
+
+    def _count(self, stat: str) -> None:
+        self._stats[stat] += 1
+        self._run_stats[stat] += 1
+        CacheSuite._dirty = True
+
+    @staticmethod
+    def make_key(url: str, params: dict = None) -> str:
+        """Cache key of url with its query params."""
+        if not params:
+            return url
+        return f'{url}?{urlencode(sorted(params.items()))}'
+
+    def get(self, url: str, headers: dict = None, params: dict = None, shrink=None) -> CachedResponse:
+        """Conditional GET for given url. If server says not modified,
+        stored body is returned. shrink is called with json body before
+        storing it, for keeping only needed fields."""
+
+        key = self.make_key(url, params)
+        headers = dict(headers or {})
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        res = http_client.get(url, headers=headers, params=params)
+
+        with self._lock:
+            if entry:
+                self._count('revalidations')
+
+            if res.status_code == 304 and entry:
+                self._count('hits')
+                entry['fetched_at'] = time.time()
+                return CachedResponse(key, 200, res.headers, entry['body'], entry)
+
+            self._count('misses')
+            try:
+                body = res.json()
+            except ValueError:
+                body = None
+            if not res.ok:
+                return CachedResponse(key, res.status_code, res.headers, body)
+
+            if shrink:
+                body = shrink(body)
+
+            # Without validators there is nothing to revalidate with
+            if res.headers.get('ETag') or res.headers.get('Last-Modified'):
+                self._entries[key] = {
+                    'etag': res.headers.get('ETag'),
+                    'last_modified': res.headers.get('Last-Modified'),
+                    'fetched_at': time.time(),
+                    'body': body,
+                }
+            else:
+                self._entries.pop(key, None)
+            CacheSuite._dirty = True
+
+        return CachedResponse(key, res.status_code, res.headers, body)
+
+    def set_selection(self, key: str, data: dict) -> None:
+        """Stores appimage data that extracted from key's body."""
+        with self._lock:
+            if key in self._entries:
+                self._entries[key]['selection'] = dict(data)
+                CacheSuite._dirty = True
+
+    def set_release(self, app: str, data: dict) -> None:
+        """Stores latest release data of app, used for offline and
+        --max-age answers."""
+        with self._lock:
+            self._releases[app] = {'data': dict(data), 'fetched_at': time.time()}
+            CacheSuite._dirty = True
+
+    def get_release(self, app: str) -> tuple:
+        """Returns stored release data of app and its age in
+        seconds, or (None, None) if app has none."""
+        with self._lock:
+            release = self._releases.get(app)
+        if not release:
+            return None, None
+        return dict(release['data']), time.time() - release['fetched_at']
+
+    def set_hint(self, key: str, hint: dict) -> None:
+        """Stores how key's data was found last time."""
+        with self._lock:
+            if self._hints.get(key) != hint:
+                self._hints[key] = dict(hint)
+                CacheSuite._dirty = True
+
+    def get_hint(self, key: str) -> dict:
+        """Stored hint of key, empty if there is none."""
+        with self._lock:
+            return dict(self._hints.get(key, {}))
+
+    def mark_revalidating(self, apps: list, window: float = 300) -> list:
+        """Marks apps as being revalidated in background. Returns
+        ones that are not already marked in last window seconds."""
+        now = time.time()
+        marked = []
+        with self._lock:
+            for app in apps:
+                release = self._releases.get(app)
+                if release and now - release.get('revalidating_at', 0) > window:
+                    release['revalidating_at'] = now
+                    marked.append(app)
+            CacheSuite._dirty = True
+        return marked
+
+    def get_stats(self) -> dict:
+        """Returns this run's and all time cache statistics."""
+        with self._lock:
+            size = os.path.getsize(self.cache_pth) if os.path.exists(self.cache_pth) else 0
+            return {
+                'run': dict(self._run_stats),
+                'total': dict(self._stats),
+                'entries': len(self._entries),
+                'size': size,
+            }
@@ -9,13 +9,180 @@ import os
 import json
 from urllib.parse import urlparse, unquote
 from pathlib import PurePosixPath
-import requests
-from cpuinfo import get_cpu_info
+from functools import lru_cache
 
 
 from .file_suite import FileSuite
-from .data.default_apps import default_apps
-from .utils import is_valid_url
+from .cache_suite import CacheSuite
+from .registry_suite import RegistrySuite
+from .rate_limit_suite import RateLimitSuite, RateLimitPostponed, NORMAL
+from .utils import is_valid_url, http_client, checksum
+
+
+def _shrink_github(body):
+    """Keeps only release fields that Aptod uses, release
+    notes makes cached json much bigger than needed."""
+    def shrink(rel):
+        return {
+            'tag_name': rel.get('tag_name'),
+            'prerelease': rel.get('prerelease'),
+            'published_at': rel.get('published_at'),
+            'assets': [
+                {
+                    'name': asset.get('name'),
+                    'browser_download_url': asset.get('browser_download_url'),
+                    'size': asset.get('size'),
+                    'digest': asset.get('digest'),
+                }
+                for asset in rel.get('assets', [])
+            ],
+        }
+
+    if isinstance(body, dict):
+        return shrink(body)
+    return [shrink(rel) for rel in body]
+
+
+def _shrink_gitlab(body):
+    """Gitlab version of _shrink_github"""
+    def shrink(rel):
+        return {
+            'tag_name': rel.get('tag_name'),
+            'released_at': rel.get('released_at'),
+            'assets': {'links': [
+                {'name': link.get('name'), 'url': link.get('url')}
+                for link in rel.get('assets', {}).get('links', [])
+            ]},
+        }
+
+    if isinstance(body, dict):
+        return shrink(body)
+    return [shrink(rel) for rel in body]
+
+
+def _release_files(asset_name: str, files: list) -> dict:
+    """Takes release files as (name, url) list, returns urls
+    of asset_name's zsync and checksum files if release has them."""
+    data = checksum.checksum_files(asset_name, files)
+    # zsync file makes delta updates possible
+    for name, url in files:
+        if name == asset_name + '.zsync':
+            data['zsync_url'] = url
+    return data
+
+
+# Releases are scanned with small pages, most repos match on first one
+SCAN_PAGE_SIZE = 10
+SCAN_MAX_PAGES = 10
+
+
+def _next_link(link_header: str) -> str:
+    """Url of rel="next" in Github Link header, or ''."""
+    match = re.search(r'<([^>]+)>;\s*rel="next"', link_header or '')
+    return match.group(1) if match else ''
+
+
+def _asset_pattern(asset_name: str) -> str:
+    r"""Regex of asset name with numbers (versions, dates) left open.
+    Exmp. Obsidian-1.4.16.AppImage > Obsidian\-[0-9]+\.[0-9]+\.[0-9]+\.AppImage"""
+    return '[0-9]+'.join(re.escape(part) for part in re.split(r'[0-9]+', asset_name))
+
+
+# Can be changed with configure(), values comes from cli or aptod.conf
+settings = {
+    # Never use network, answer from stored release data
+    'offline': False,
+    # Stored release data younger than this (seconds) is used as is
+    'max_age': None,
+    # Api roots, exmp. a Github Enterprise host or a local test server
+    'github_api': 'https://api.github.com',
+    'gitlab_api': 'https://gitlab.com/api/v4',
+}
+
+
+def configure(**kwargs) -> None:
+    """Updates release data freshness and api settings."""
+    unknown = set(kwargs) - set(settings)
+    if unknown:
+        raise ValueError(f'Unknown extract setting(s): {", ".join(unknown)}')
+    settings.update(kwargs)
+    for key in ('github_api', 'gitlab_api'):
+        settings[key] = settings[key].rstrip('/')
+
+
+PROCESSOR_ARCH_LIST = (
+    ('aarch64', 'arm64'),
+    ('armv7hl', 'armhf', 'arm32'),
+    ('x86_64', 'x64', 'amd64', '64bit'),
+    ('i386', 'ia32', 'i486', 'i686', 'x86'),
+)
+
+
+@lru_cache(maxsize=None)
+def host_arch() -> str:
+    """Host machine processor arch, detected once per process."""
+    my_proc = platform.machine()
+    if my_proc:
+        return my_proc.lower()
+
+    # Above do not works on some machines, cpuinfo is very slow
+    # so its result is kept on disk for this machine.
+    cache_pth = os.path.join(FileSuite().cfg_dir, 'host_arch.json')
+    try:
+        with open(cache_pth, 'r', encoding="utf-8") as file:
+            data = json.load(file)
+        if data.get('node') == platform.node() and data.get('arch'):
+            return data['arch']
+    except (OSError, json.decoder.JSONDecodeError):
+        pass
+
+    from cpuinfo import get_cpu_info
+    my_proc = get_cpu_info()['arch'].lower()
+    os.makedirs(os.path.dirname(cache_pth), exist_ok=True)
+    with open(cache_pth, 'w', encoding="utf-8") as file:
+        json.dump({'node': platform.node(), 'arch': my_proc}, file)
+    return my_proc
+
+
+def _trie_regex(words: list, suffixes: dict) -> str:
+    """Regex that matches any of words, alternatives are grouped by
+    common prefixes so regex engine checks each position only once.
+    suffixes is word -> extra pattern required after that word."""
+    trie: dict = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = suffixes.get(word, '')
+
+    def build(node: dict) -> str:
+        alternatives = [
+            child if char == '' else re.escape(char) + build(child)
+            for char, child in sorted(node.items())
+        ]
+        if len(alternatives) == 1:
+            return alternatives[0]
+        return '(?:' + '|'.join(alternatives) + ')'
+
+    return build(trie)
+
+
+@lru_cache(maxsize=None)
+def _incompatible_arch_pattern(my_proc: str):
+    """One regex that finds any arch name which is not
+    compatible with my_proc, built once per host arch."""
+
+    incompatible = [
+        proc for group in PROCESSOR_ARCH_LIST if my_proc not in group for proc in group]
+    # Special treament for x86 and x86_64 confuse
+    return re.compile(_trie_regex(incompatible, {'x86': '(?!_64)'}))
+
+
+def is_compatible_asset(file_name: str, my_proc: str = None) -> bool:
+    """If given file_name includes any processor architecture,
+    checks it's compatible with my_proc (host arch by default)."""
+    pattern = _incompatible_arch_pattern(my_proc or host_arch())
+    return pattern.search(file_name.lower()) is None
 
 
 class ExtractSuite:
@@ -24,42 +191,23 @@ class ExtractSuite:
     """
 
     def __init__(self):
-        self.processor_arch_list = [
-            ['aarch64', 'arm64'],
-            ['armv7hl', 'armhf', 'arm32'],
-            ['x86_64', 'x64', 'amd64', '64bit'],
-            ['i386', 'ia32', 'i486', 'i686', 'x86']
-        ]
+        self.cache = CacheSuite()
+        self.registry = RegistrySuite()
+        # app name -> app data, filled by prefetch()
+        self.prefetched: dict = {}
+        self.processor_arch_list = PROCESSOR_ARCH_LIST
+        self.rate_limit = RateLimitSuite(self._github_token())
+        # Github requests of apps named by user gets HIGH, background checks BACKGROUND
+        self.priority = NORMAL
+        # Age of release data answered from store, and stale ones
+        self.ages: dict = {}
+        self.stale: list = []
 
     def _compatible_with_my_proccessor(self, file_name: str) -> bool:
         """If given file_name includes any processor
         architecture, then check is compatible
         with users proscessor."""
-        
-        # Find host machine proc arch
-        my_proc = platform.machine()
-        # Above do not works on some machines but way faster
-        if not my_proc:
-            my_proc = get_cpu_info()['arch']
-
-        incompatible_arch_list: list = []
-        # proc is list
-        for proc in self.processor_arch_list:
-            # Add arch to incompatible_arch_list if its not compatible with host machine
-            if my_proc.lower() not in proc:
-                incompatible_arch_list = [*incompatible_arch_list, *proc]
-        
-        # If file_name includes any incompatible arch type inside its name return false
-        for proc in incompatible_arch_list:
-            for re_item in re.findall(r'\w+', file_name, re.IGNORECASE):
-                # Special treament for x86 and x86_64 confuse
-                if proc == 'x86':
-                    if 'x86_64' not in re_item and proc in re_item:
-                        return False
-                elif proc in re_item:
-                    return False
-
-        return True
+        return is_compatible_asset(file_name)
 
     def _nail_version(self, down_url: str) -> str:
         """Takes downloading url as argument,
@@ -90,6 +238,152 @@ class ExtractSuite:
 
         return name
 
+    def _github_app_data(self, rel_list: list, pattern: str = None) -> dict:
+        """Returns latest release data from Github release list.
+        If a release has many compatible AppImages, one that
+        matches pattern (same naming as last time) is preferred."""
+
+        # Remove prereleased items in r_list
+        rel_list = [rel for rel in rel_list if rel['prerelease'] is False]
+
+        for rel in rel_list:
+            # 1) Bellow, If asset matchs with regex, than thats a appimage
+            # 2) If AppImage inlcudes processor arc type than choose compatible one.
+            assets = [
+                asset for asset in rel.get('assets')
+                if (re.search('.AppImage$', asset['name'], re.IGNORECASE) and
+                    self._compatible_with_my_proccessor(asset['name']))
+            ]
+            if pattern:
+                assets.sort(key=lambda asset: not re.fullmatch(pattern, asset['name']))
+            for asset in assets[:1]:
+                data = {
+                    'down_url': asset['browser_download_url'],
+                    # name is changed by _nail_version, checksum files list this one
+                    'asset_name': asset['name'],
+                    'version': rel.get('tag_name'),
+                    'size': asset.get('size'),
+                    **_release_files(asset['name'], [
+                        (_['name'], _['browser_download_url']) for _ in rel.get('assets')]),
+                }
+                # Github publishes digest of newer assets
+                if asset.get('digest'):
+                    data['sha256'] = asset['digest']
+                return data
+        return {}
+
+    def _github_token(self) -> str:
+        """Returns Github token from GITHUB_TOKEN env
+        variable or GithubToken in aptod.conf, if any."""
+        return os.environ.get('GITHUB_TOKEN') or FileSuite().get_config().get('GithubToken', '')
+
+    def github_batch_extractor(self, repos: dict, releases: int = 10, batch_size: int = 25) -> dict:
+        """Takes app name -> (owner, repo) dictionary and resolves
+        all of them with aliased Github GraphQL queries, batch_size
+        repos per request. Returns app name -> app data. Apps without
+        AppImage in first releases are left out, so caller falls back
+        to REST for them. Requires token, returns empty dictionary if
+        there is no token or request fails so caller can fall back to REST."""
+
+        token = self._github_token()
+        if not token or not repos:
+            return {}
+
+        headers = {'Authorization': f'bearer {token}'}
+        items = list(repos.items())
+        results: dict = {}
+
+        for start in range(0, len(items), batch_size):
+            batch = items[start:start + batch_size]
+            try:
+                reservation = self.rate_limit.acquire('graphql', self.priority)
+            except RateLimitPostponed:
+                # Rest of apps are tried with REST, it has own budget
+                return results
+            fields = []
+            for index, (_, (owner, repo)) in enumerate(batch):
+                fields.append(
+                    f'r{index}: repository(owner: {json.dumps(owner)}, name: {json.dumps(repo)}) {{'
+                    f' releases(first: {releases}, orderBy: {{field: CREATED_AT, direction: DESC}}) {{'
+                    ' nodes { tagName isPrerelease isDraft isLatest publishedAt'
+                    ' releaseAssets(first: 50) { nodes { name downloadUrl size } } } } }')
+            query = 'query { ' + ' '.join(fields) + ' }'
+
+            try:
+                res = http_client.post(
+                    settings['github_api'] + '/graphql', json={'query': query}, headers=headers)
+            except OSError:
+                self.rate_limit.release(reservation, 'graphql')
+                return results
+            self.rate_limit.observe(res.headers, 'graphql', reservation)
+            try:
+                res.raise_for_status()
+                res_json = res.json()
+            except (OSError, ValueError):
+                return results
+
+            # Missing repos comes as null with errors, others still usable
+            res_data = res_json.get('data')
+            if res_data is None:
+                return results
+            for index, (app, (owner, repo)) in enumerate(batch):
+                repository = res_data.get(f'r{index}')
+                if not repository:
+                    results[app] = {'Error': f"Not found {owner}/{repo}"}
+                    continue
+
+                # Same shape with REST releases, latest release comes first like /latest
+                rel_list = [
+                    {
+                        'tag_name': node['tagName'],
+                        'prerelease': node['isPrerelease'] or node['isDraft'],
+                        'published_at': node['publishedAt'],
+                        'assets': [
+                            {
+                                'name': asset['name'],
+                                'browser_download_url': asset['downloadUrl'],
+                                'size': asset['size'],
+                            }
+                            for asset in node['releaseAssets']['nodes']
+                        ],
+                    }
+                    for node in sorted(
+                        repository['releases']['nodes'], key=lambda node: not node['isLatest'])
+                ]
+
+                data = self._github_app_data(rel_list)
+                if not data:
+                    # AppImage may be in older releases, REST scan pages further
+                    continue
+                data['name'] = self._nail_version(data['down_url'])
+                results[app] = data
+
+        return results
+
+    def prefetch(self, app_list: list) -> None:
+        """Resolves Github apps in app_list with one batched
+        request, later get() calls for them returns from memory.
+        Without token nothing is done and get() uses REST."""
+
+        if not self._github_token() or settings['offline']:
+            return
+
+        repos = {}
+        for app in app_list:
+            # Fresh or stale, stored data is answered without network
+            if self.stored(app)[0] is not None:
+                continue
+            source = self.registry.source(app)
+            if source and 'owner' in source:
+                repos[app] = (source['owner'], source['repo'])
+
+        for app, data in self.github_batch_extractor(repos).items():
+            if self.registry.source(app)['type'] == 'url' and not data.get('Error'):
+                FileSuite().update_repo(data)
+            if not data.get('Error'):
+                self.cache.set_release(app, data)
+            self.prefetched[app] = data
+
     def github_extractor(self, owner=None, repo=None, url=None) -> dict:
         """Takes Github repo and it's owner as arugment or instead 
         directly url for repo. Returns latest release data for appImage."""
@@ -99,16 +393,32 @@ class ExtractSuite:
             owner = PurePosixPath(unquote(urlparse(url).path)).parts[1]
             repo = PurePosixPath(unquote(urlparse(url).path)).parts[2]
 
-        api_url = f'https://api.github.com/repos/{owner}/{repo}/releases'
+        api_url = f"{settings['github_api']}/repos/{owner}/{repo}/releases"
 
     
-        def get_releases(url: str, page: int = 1, per_page: int = 30) -> list:
+        def get_releases(url: str, params: dict = None):
             headers = {
                 'X-GitHub-Api-Version': '2022-11-28',
                 "Accept": "application/vnd.github+json"
             }
-            params = {'per_page': per_page, 'page': page}
-            res = requests.get(url, headers=headers, params=params, timeout=5)
+            # Token raises hourly limit from 60 to 5000
+            token = self._github_token()
+            if token:
+                headers['Authorization'] = f'Bearer {token}'
+
+            # Postpone instead of failing halfway when budget is low
+            try:
+                reservation = self.rate_limit.acquire('core', self.priority)
+            except RateLimitPostponed as err:
+                return None, [{'Error': str(err), 'Postponed': err.reset}]
+
+            try:
+                res = self.cache.get(url, headers=headers, params=params, shrink=_shrink_github)
+            except OSError:
+                self.rate_limit.release(reservation)
+                raise
+            # 304 revalidations aren't counted, server's remaining tells it
+            self.rate_limit.observe(res.headers, 'core', reservation)
             res_json = res.json()
 
             # Let user know, if rate limit ended.
@@ -118,61 +428,86 @@ class ExtractSuite:
                         int(res.headers['X-RateLimit-Reset']) - int(time.time())
                     )
                 )
-                return [{
-                    'Error': f"Your hourly Github api rate limit (60) exceeded."
-                    f"Limit will be reset after {remaining_time} minutes."
+                return res, [{
+                    'Error': f"Your hourly Github api rate limit ({res.headers.get('X-RateLimit-Limit')}) exceeded."
+                    f"Limit will be reset after {remaining_time} minutes.",
+                    'Postponed': int(res.headers['X-RateLimit-Reset']),
                 }]
             if res.status_code == 404:
-                return [{
+                return res, [{
                     'Error': f"Not found {owner}/{repo}"
                 }]
             # If it's latest release then r.json() is only one item as dict
             if isinstance(res_json, dict):
-                return [res_json]
-            return res_json
-
-        def app_data(rel_list: list) -> dict:
-            """Returns latest release data from list."""
-
-            # Remove prereleased items in r_list
-            rel_list = [rel for rel in rel_list if rel['prerelease'] is False]
-
-            for rel in rel_list:
-                for asset in rel.get('assets'):
-                    # 1) Bellow, If asset matchs with regex, than thats a appimage
-                    # 2) If AppImage inlcudes processor arc type than choose compatible one.
-                    if (re.search('.AppImage$', asset['name'], re.IGNORECASE) and
-                        self._compatible_with_my_proccessor(asset['name'])):
-                        return {
-                            'down_url': asset['browser_download_url']
-                        }
-            return {}
-
-        # Try for latest, it will not work for most of repos...
-        releases = get_releases(api_url + '/latest')
+                return res, [res_json]
+            return res, res_json
+
+        def cached_app_data(url: str, params: dict = None) -> tuple:
+            """_github_app_data() of url's releases and the response.
+            If releases are not modified since last request, stored
+            result is used."""
+            res, releases = get_releases(url, params)
+
+            # If rate limit ends than it will work.
+            if releases and releases[0].get('Error'):
+                return res, releases, releases[0]
+
+            if res.not_modified and res.selection is not None:
+                return res, releases, dict(res.selection)
+
+            data = self._github_app_data(releases, pattern)
+            self.cache.set_selection(res.key, data)
+            return res, releases, data
+
+        def scan_releases() -> tuple:
+            """Follows Link header page by page, stops at first page
+            that has a compatible AppImage. Returns data and position
+            of its release in whole list."""
+            # First page reaches last match, plus some newer releases
+            per_page = min(100, max(SCAN_PAGE_SIZE, hint.get('position', 0) + SCAN_PAGE_SIZE))
+            page_url, params = api_url, {'per_page': per_page}
+            seen = 0
+            for _ in range(SCAN_MAX_PAGES):
+                res, releases, data = cached_app_data(page_url, params)
+                if data.get('Error'):
+                    return data, 0
+                if data:
+                    tags = [rel.get('tag_name') for rel in releases]
+                    return data, seen + (tags.index(data['version']) if data['version'] in tags else 0)
+                seen += len(releases)
+                page_url, params = _next_link(res.headers.get('Link')), None
+                if not page_url:
+                    break
+            return {}, 0
 
-        # If rate limit ends than it will work.
-        if releases and releases[0].get('Error'):
-            data = releases[0]
-            return data
+        # Last check tells where AppImage was and how it was named
+        hint_key = f'github:{owner}/{repo}'.lower()
+        hint = self.cache.get_hint(hint_key)
+        pattern = hint.get('pattern')
 
-        data = app_data(releases)
+        # Most repos have AppImage in latest release, one cheap request
+        data, release, position = {}, 'latest', 0
+        if hint.get('release') != 'scan':
+            _, _, data = cached_app_data(api_url + '/latest')
+            if data.get('Error'):
+                return data
 
-        # If latest request gets empty, than make new one thats not only for latest
+        # Otherwise releases are scanned, newest first
         if not data:
-            page = 0
-            per_page = 0
-            for _ in range(1):
-                page += 1
-                per_page += 50
-                data = app_data(get_releases(api_url, page=page, per_page=per_page))
-                if data:
-                    break
+            (data, position), release = scan_releases(), 'scan'
+            if data.get('Error'):
+                return data
 
         # After above requests, still no data. Than return error message.
         if not data:
             return {'Error': f'No release has been found for appImage at {repo}.'}
 
+        self.cache.set_hint(hint_key, {
+            'pattern': _asset_pattern(unquote(data['down_url'].rsplit('/', 1)[-1])),
+            'release': release,
+            'position': position,
+        })
+
         # Get name for data, from down_url
         data['name'] = self._nail_version(data['down_url'])
         if url: FileSuite().update_repo(data)
@@ -183,21 +518,23 @@ class ExtractSuite:
         arugment. Returns latest appImage data.
         If couldn't find data returns empty dictionary."""
 
-        api_url = f'https://gitlab.com/api/v4/projects/{project_id}/releases/'
+        api_url = f"{settings['gitlab_api']}/projects/{project_id}/releases/"
 
-        def get_releases(url: str) -> list:
+        def get_releases(url: str):
             # Build url
 
             headers = {
                 "User-Agent": "Mozilla/5.0 (Windows NT 10.0; rv:102.0)",
             }
-            res = requests.get(url, headers=headers, timeout=5)
-            res.raise_for_status()
+            res = self.cache.get(url, headers=headers, shrink=_shrink_gitlab)
+            if not res.ok:
+                from requests import HTTPError
+                raise HTTPError(f'{res.status_code} Error for url: {url}')
 
             if isinstance(res.json(), dict):
-                return [res.json()]
+                return res, [res.json()]
 
-            return res.json()
+            return res, res.json()
 
         def app_data(rel_list: list) -> dict:
             """Returns latest release data from list."""
@@ -208,57 +545,100 @@ class ExtractSuite:
                 # If there is i386 (32-bit) or aarch keep search for 64-bit
                     if (re.search('.AppImage$', url['name']) and
                         self._compatible_with_my_proccessor(url['name'])):
-                        return {
-                            'down_url': url['url']
+                        data = {
+                            'down_url': url['url'],
+                            'asset_name': url['name'],
+                            'version': rel.get('tag_name'),
+                            **_release_files(url['name'], [
+                                (_['name'], _['url']) for _ in rel['assets']['links']]),
                         }
+                        return data
             return {}
 
         ## Final part
-        releases = get_releases(api_url)
-        data = app_data(releases)
+        res, releases = get_releases(api_url)
+        if res.not_modified and res.selection is not None:
+            data = dict(res.selection)
+        else:
+            data = app_data(releases)
+            self.cache.set_selection(res.key, data)
         # Get name for data, from down_url
         data['name'] = self._nail_version(data['down_url'])
         return  data
 
     
 
+    def stored(self, app: str) -> tuple:
+        """Stored release data of app if settings allow using it without
+        network, and its age. Returns (None, age) if network is needed."""
+        if not (settings['offline'] or settings['max_age'] is not None):
+            return None, None
+        data, age = self.cache.get_release(app)
+        if data is None and settings['offline']:
+            return {'Error': f'No stored release data for {app}, run once without --offline.'}, None
+        if data is not None:
+            self.ages[app] = age
+            if not settings['offline'] and age > settings['max_age']:
+                # Stale while revalidate, answer now and refresh in background
+                if app not in self.stale:
+                    self.stale.append(app)
+        return data, age
+
+    def revalidate_stale(self) -> list:
+        """Starts a background aptod process that refreshes stale
+        release data, if network is reachable. Returns those apps."""
+        api = urlparse(settings['github_api'])
+        if (settings['offline'] or not self.stale or
+                not http_client.is_reachable(api.hostname, api.port or (443 if api.scheme == 'https' else 80))):
+            return []
+        apps = self.cache.mark_revalidating(self.stale)
+        if not apps:
+            return []
+        # Child reads cache file, so marks and latest answers must be on disk
+        self.cache.save()
+
+        import sys
+        import subprocess
+        subprocess.Popen(
+            [sys.executable, '-m', 'aptod', '--revalidate', *apps],
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            start_new_session=True)
+        return apps
+
     def get(self, app: str):
         """
         Returns app data or available app list
         """
-     
-        apps: dict = {}
-    
-        # Data imported from aptod.data
-        for app_ in default_apps:
-            if app_['type'] == 'github':
-                parsed_path = app_['path'].split('/')
-                
-                owner, repo = parsed_path[0], parsed_path[1]
-                apps.update(
-                    {app_['name']: lambda owner=owner, repo=repo: self.github_extractor(owner, repo)})
-            else:
-                apps.update(
-                    {app_['name']: lambda project_id=app_['projectId']: self.gitlab_extractor(project_id)})
-
-        
+
         # Return list of avaliable apps
-        build_in_apps = [_['name'] for _ in default_apps]
-        repo_apps = FileSuite().get_repo()
-        
-        if app == 'all':            
-            return [*build_in_apps, *repo_apps.keys()]
-        
+        if app == 'all':
+            return self.registry.names()
+
+        if app in self.prefetched:
+            return dict(self.prefetched[app])
+
+        data, _ = self.stored(app)
+        if data is not None:
+            return data
+
+        data = self._resolve(app)
+        if data and not data.get('Error'):
+            self.cache.set_release(app, data)
+        return data
+
+    def _resolve(self, app: str):
+        """Latest release data of app from its source."""
+
         # If app is url...
         if isinstance(app, str) and is_valid_url(app):
             if 'github' in app:
                 return self.github_extractor(url=app)
-        
-        if app in build_in_apps:
-            return apps[app.lower()]()
-        
-        if app in repo_apps:
-            
-            return self.github_extractor(url=repo_apps[app])
-
-        return None
+
+        source = self.registry.source(app)
+        if not source:
+            return None
+        if source['type'] == 'github':
+            return self.github_extractor(source['owner'], source['repo'])
+        if source['type'] == 'gitlab':
+            return self.gitlab_extractor(source['projectId'])
+        return self.github_extractor(url=source['url'])
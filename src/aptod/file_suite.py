@@ -8,8 +8,131 @@ import shutil
 import os
 import json
 import  re
+import hashlib
+import threading
 
 from .utils import IconHandler
+from .utils.icon_handler import icon_theme_dir
+from .utils.squashfs import appimage_metadata
+
+# Update checks run in threads, repo file writes must not interleave
+_repo_lock = threading.Lock()
+
+# Exec and TryExec values are pointed to new AppImage on updates
+_EXEC_KEYS = ('Exec', 'TryExec')
+_APPIMAGE_ARG = re.compile(r'"[^"]*\.appimage"|[^\s"]*\.appimage', re.IGNORECASE)
+
+
+def applications_dir() -> str:
+    """User's folder of .desktop files."""
+    data_dir = os.environ.get('XDG_DATA_HOME') or os.path.join(os.path.expanduser('~'), '.local/share')
+    return os.path.join(data_dir, 'applications')
+
+
+def _exec_arg(path: str) -> str:
+    """path as Exec argument, quoted if it has reserved characters."""
+    path = path.replace('%', '%%')
+    if re.search(r'[\s"\'\\><~|&;$*?#()`]', path):
+        return '"' + re.sub(r'(["`$\\])', r'\\\1', path) + '"'
+    return path
+
+
+def desktop_entry(app_path: str, name: str, icon: str, extra: dict = None) -> str:
+    """Content of a new .desktop file, same input gives same content."""
+    lines = [
+        '[Desktop Entry]',
+        'Encoding=UTF-8',
+        'Type=Application',
+        'Terminal=false',
+        f'Exec={_exec_arg(app_path)}',
+        f'Name={name}',
+        f'Icon={icon}',
+    ]
+    lines += [f'{key}={value}' for key, value in (extra or {}).items()]
+    return '\n'.join(lines) + '\n'
+
+
+def repoint_desktop_entry(text: str, app_path: str):
+    """Existing .desktop content with its Exec and TryExec lines pointed to
+    app_path, other lines are kept. None if no line points to an AppImage."""
+    lines, found = [], False
+    for line in text.splitlines():
+        # Old Aptod versions indented every line
+        line = line.strip()
+        key = line.split('=', 1)[0].strip()
+        if '=' in line and key in _EXEC_KEYS:
+            value = line.split('=', 1)[1]
+            match = _APPIMAGE_ARG.search(value)
+            if match:
+                found = True
+                line = f'{key}={value[:match.start()]}{_exec_arg(app_path)}{value[match.end():]}'
+        lines.append(line)
+    return '\n'.join(lines) + '\n' if found else None
+
+
+def write_if_changed(path: str, content: str) -> bool:
+    """Writes content to path atomically, only if its hash differs
+    from the file's. Returns True if file is written."""
+    data = content.encode('utf-8')
+    try:
+        with open(path, 'rb') as file:
+            if hashlib.sha256(file.read()).digest() == hashlib.sha256(data).digest():
+                return False
+    except OSError:
+        pass
+    tmp_pth = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_pth, 'wb') as file:
+        file.write(data)
+    os.replace(tmp_pth, path)
+    return True
+
+
+class DesktopBatch:
+    """Desktop integration of several apps. Desktop database and icon
+    cache are refreshed once when batch ends, only if something is
+    changed and their tools are installed. Use as context manager."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._desktop = self._icons = False
+        self.desktop_writes = 0
+        self.icon_writes = 0
+        self.refreshes = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        # Files are written even if batch failed, caches should know them
+        self.flush()
+
+    def desktop_changed(self) -> None:
+        with self._lock:
+            self._desktop = True
+            self.desktop_writes += 1
+
+    def icon_changed(self) -> None:
+        with self._lock:
+            self._icons = True
+            self.icon_writes += 1
+
+    def flush(self) -> None:
+        """Refreshes caches of changes since last flush."""
+        with self._lock:
+            commands = []
+            if self._desktop:
+                commands.append(['update-desktop-database', '-q', applications_dir()])
+            if self._icons:
+                commands.append(['gtk-update-icon-cache', '-q', '-f', '-t', icon_theme_dir()])
+            self._desktop = self._icons = False
+
+        for command in commands:
+            if not shutil.which(command[0]):
+                continue
+            # Slow to import, most runs change nothing
+            import subprocess
+            subprocess.run(command, capture_output=True, check=False)
+            self.refreshes += 1
 
 
 class FileSuite:
@@ -20,6 +143,7 @@ class FileSuite:
         self.cfg_pth = os.path.join(self.cfg_dir, 'aptod.conf')
         self.repo_pth = os.path.join(self.cfg_dir, 'aptod_repo.json')
         self.unofficial_repo_pth = os.path.join(self.cfg_dir, 'unofficial_repo.json')
+        self.installed_pth = os.path.join(self.cfg_dir, 'installed.json')
 
     def create_config(self) -> None:
         """Creates config file for user."""
@@ -84,16 +208,17 @@ class FileSuite:
         url = app_data['down_url']
         app_name = app_name_generator(url)
         
-        if not os.path.exists(self.repo_pth):
-            self.create_repo()
+        with _repo_lock:
+            if not os.path.exists(self.repo_pth):
+                self.create_repo()
 
-        with open(self.repo_pth, "r", encoding="utf-8") as data_file:
-            # Reading old data
-            data = json.load(data_file)
+            with open(self.repo_pth, "r", encoding="utf-8") as data_file:
+                # Reading old data
+                data = json.load(data_file)
 
-        data[app_name] = url
-        with open(self.repo_pth, 'w', encoding="utf-8") as file:
-            json.dump(data, file, indent = 2)
+            data[app_name] = url
+            with open(self.repo_pth, 'w', encoding="utf-8") as file:
+                json.dump(data, file, indent = 2)
 
         return data
 
@@ -136,6 +261,57 @@ class FileSuite:
 
         return data
 
+    def _dir_snapshot(self, apps_folder: str) -> dict:
+        """Modification times of apps folder and its sub folders.
+        Adding or removing a file changes its folder's mtime."""
+        snapshot = {'.': os.stat(apps_folder).st_mtime_ns}
+        with os.scandir(apps_folder) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    snapshot[entry.name] = entry.stat().st_mtime_ns
+        return snapshot
+
+    def get_installed_index(self) -> dict:
+        """Returns installed apps manifest."""
+        if not os.path.exists(self.installed_pth):
+            return {'apps': {}, 'dirs': {}}
+
+        with open(self.installed_pth, "r", encoding="utf-8") as data_file:
+            try:
+                return json.load(data_file)
+            except json.decoder.JSONDecodeError:
+                # It's rebuilt from apps folder
+                return {'apps': {}, 'dirs': {}}
+
+    def is_index_fresh(self, index: dict, apps_folder: str) -> bool:
+        """False if apps folder changed after manifest was written."""
+        return index.get('dirs') == self._dir_snapshot(apps_folder)
+
+    def save_installed_index(self, apps: dict, apps_folder: str) -> None:
+        """Writes installed apps manifest with current folder state."""
+        self._write_index({'apps': apps, 'dirs': self._dir_snapshot(apps_folder)})
+
+    def set_installed_app(self, app: str, data: dict, apps_folder: str, app_dir: str) -> None:
+        """Sets one app of manifest without scanning apps folder. Only
+        app's own folder is taken into folder state, so changes made
+        to other folders out of Aptod are still noticed."""
+        index = self.get_installed_index()
+        index.setdefault('apps', {})[app] = data
+        dirs = index.setdefault('dirs', {})
+        if os.path.exists(apps_folder):
+            dirs['.'] = os.stat(apps_folder).st_mtime_ns
+            name = os.path.relpath(app_dir, apps_folder)
+            if os.sep not in name and name not in ('.', '..') and os.path.isdir(app_dir):
+                dirs[name] = os.stat(app_dir).st_mtime_ns
+        self._write_index(index)
+
+    def _write_index(self, index: dict) -> None:
+        os.makedirs(self.cfg_dir, exist_ok=True)
+        tmp_pth = self.installed_pth + '.tmp'
+        with open(tmp_pth, 'w', encoding="utf-8") as file:
+            json.dump(index, file, indent=2)
+        os.replace(tmp_pth, self.installed_pth)
+
     def find_app(self, directory: str, name: str) -> str:
         """ Returns first file path that ends with .appimage extension
         from given path's folder that includes name."""
@@ -153,64 +329,71 @@ class FileSuite:
         # raise FileNotFoundError(f'App is not exist in "{directory}"')
         return ''
 
-    def create_desktop(self, app_data) -> None:
-        """Creates .desktop files but if they exist
-        than only updates with new data."""
+    @staticmethod
+    def desktop_name(file_name: str) -> str:
+        """Name of app's .desktop and icon files.
+        Exmp. Tutanota-3.1.AppImage > tutanota"""
+        return re.findall(r'\w+', file_name)[0].lower()
+
+    def prefetch_icon(self, app_data: dict) -> None:
+        """Starts getting icon while app downloads, it's used if AppImage
+        has no icon. Nothing is fetched if icon is cached already, or
+        installed version (updates) ships its own icon."""
+        handler = IconHandler()
+        app_name = self.desktop_name(app_data['name'])
+        if os.path.exists(handler.cache_path(app_name)):
+            return
+        if app_data.get('app_cur_path') and appimage_metadata(app_data['app_cur_path']).get('icon'):
+            return
+        handler.prefetch(app_name)
 
-        example_dot = """[Desktop Entry]
-            Encoding=UTF-8
-            Type=Application
-            Terminal=false
-            Exec={app_path}
-            Name={app_name}
-            Icon={app_icon_path}"""   
+    def create_desktop(self, app_data, batch=None) -> None:
+        """Creates .desktop files but if they exist
+        than only updates with new data. Changes are
+        collected in batch, without it caches are refreshed right away."""
+        if batch is None:
+            with DesktopBatch() as batch:
+                self.create_desktop(app_data, batch)
+            return
 
         app_full_path = os.path.join(app_data['app_down_path'], app_data['name'])
         # Make .AppImage file exacutable
-        os.system(f'chmod +x {app_full_path}')
-
-        path = f'{os.path.expanduser("~")}/.local/share/applications/'
-        if not os.path.exists(path):
-            os.makedirs(path)
-
-        app_name = re.findall(r'\w+', app_data['name'])[0].lower()
-        desktop_path = f'{path}{app_name}.desktop'
-        app_icon_path = os.path.join(app_data['app_down_path'], "icon.png")
-
-        if not os.path.exists(app_icon_path):
-            with open(app_icon_path, 'wb') as file:      
-                file.write(IconHandler().get_icon(app_name))
-
-        # If .desktop is exist only change version
-        if not os.path.exists(desktop_path): 
-            example_dot = example_dot.replace(
-                '{app_path}', os.path.join(app_data['app_down_path'], app_data['name']))
-            example_dot = example_dot.replace('{app_name}', re.findall(r'\w+', app_data['name'])[0])
-            example_dot = example_dot.replace('{app_icon_path}', app_icon_path)
-
-            with open(desktop_path, 'w', encoding="utf-8") as file:
-                file.write(example_dot)
-        else:
-            # If .dekstop exist than only update app name in .desktop
+        mode = os.stat(app_full_path).st_mode
+        if mode & 0o111 != 0o111:
+            os.chmod(app_full_path, mode | 0o111)
+
+        path = applications_dir()
+        os.makedirs(path, exist_ok=True)
+
+        app_name = self.desktop_name(app_data['name'])
+        desktop_path = os.path.join(path, f'{app_name}.desktop')
+
+        # Icon and desktop entry shipped in AppImage, read without network
+        metadata = appimage_metadata(app_full_path)
+        entry = metadata.get('desktop', {})
+        # Prefetched icon is used if AppImage has none
+        icon_name, icon_changed = IconHandler().install_icon(app_name, metadata.get('icon'))
+        if icon_changed:
+            batch.icon_changed()
+
+        # If .desktop is exist only point it to new file, user's edits are kept
+        content = None
+        if os.path.exists(desktop_path):
             with open(desktop_path, 'r', encoding="utf-8") as file:
-                desktop_f = file.read()
-            # Get the will replaced item
-            first_word = re.findall(r'\w+', app_data['name'])[0]
-            to_replace = re.search(f'{first_word}(.*).AppImage', desktop_f).group()
-            # When sub dir name is same with app name, remove sub dir name
-            if '/' in to_replace:
-                to_replace = to_replace.split('/')[-1]
-            desktop_f = desktop_f.replace(to_replace, app_data['name'])
-            with open(desktop_path, 'w', encoding="utf-8") as file:
-                file.write(desktop_f)
+                content = repoint_desktop_entry(file.read(), app_full_path)
+        if content is None:
+            content = desktop_entry(
+                app_full_path, entry.get('Name') or re.findall(r'\w+', app_data['name'])[0],
+                icon_name, {key: entry[key] for key in ('Comment', 'Categories') if entry.get(key)})
+
+        if write_if_changed(desktop_path, content):
+            batch.desktop_changed()
 
     def remove_app_files(self, path) -> None:
         """Removes related files for given appimage."""
 
-        desktop_sub_path = f'{os.path.expanduser("~")}/.local/share/applications/'
-
-        app_desktop_file = desktop_sub_path
-        app_desktop_file += re.findall(r'\w+', path.split('/')[-1])[0].lower() + '.desktop'
+        app_name = self.desktop_name(path.split('/')[-1])
+        app_desktop_file = os.path.join(applications_dir(), app_name + '.desktop')
         path = path.replace('/' + path.split('/')[-1], '')
 
         # Bellow could be dangerous if any bugs occur!
@@ -218,3 +401,4 @@ class FileSuite:
         if 'appImage' in path:
             shutil.rmtree(path)
             os.remove(app_desktop_file)
+            IconHandler().remove_icon(app_name, cached=True)
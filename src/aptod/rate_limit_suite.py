@@ -0,0 +1,143 @@
+"""
+Github api rate limit budget.
+Remaining requests are read from X-RateLimit-* headers of every
+response and kept in a state file, so parallel Aptod processes share
+one budget. Requests on the way are reserved from it until their
+response tells server's count, 304 revalidations aren't counted by
+Github so they cost nothing. Low priority requests are postponed
+before budget ends, so apps named by user can still be checked.
+"""
+
+import os
+import json
+import time
+import fcntl
+import hashlib
+import threading
+
+from .file_suite import FileSuite
+
+
+# Request priorities, lower is more important
+HIGH, NORMAL, BACKGROUND = 0, 1, 2
+
+# Part of hourly limit that priority can't use, kept for more important ones
+RESERVE = {HIGH: 0.0, NORMAL: 0.1, BACKGROUND: 0.5}
+
+# Reservations of requests that never got an answer (killed process) expire
+RESERVATION_TTL = 60
+
+# Limits before first response tells real ones
+DEFAULT_LIMITS = {
+    ('core', False): 60,
+    ('core', True): 5000,
+    ('graphql', True): 5000,
+}
+
+
+class RateLimitPostponed(Exception):
+    """Request is postponed until rate limit resets."""
+
+    def __init__(self, resource: str, reset: float):
+        self.resource = resource
+        self.reset = reset
+        reset_time = time.strftime('%H:%M', time.localtime(reset))
+        super().__init__(f'Github api rate limit is low, check is postponed until {reset_time}.')
+
+
+class RateLimitSuite:
+    """Shared Github rate limit budget of a token (or no token)."""
+
+    _lock = threading.Lock()
+
+    def __init__(self, token: str = ''):
+        self.state_pth = os.path.join(FileSuite().cfg_dir, 'rate_limit.json')
+        self.has_token = bool(token)
+        # Budget belongs to token, token itself is never written to disk
+        self.owner = hashlib.sha256(token.encode()).hexdigest()[:12] if token else 'anonymous'
+
+    def _key(self, resource: str) -> str:
+        return f'{self.owner}:{resource}'
+
+    def _update(self, func):
+        """Runs func(state) with state file locked against other processes,
+        and writes state back."""
+        os.makedirs(os.path.dirname(self.state_pth), exist_ok=True)
+        with self._lock, open(self.state_pth + '.lock', 'w', encoding="utf-8") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                with open(self.state_pth, 'r', encoding="utf-8") as file:
+                    state = json.load(file)
+            except (OSError, json.decoder.JSONDecodeError):
+                state = {}
+
+            result = func(state)
+
+            tmp_pth = self.state_pth + '.tmp'
+            with open(tmp_pth, 'w', encoding="utf-8") as file:
+                json.dump(state, file)
+            os.replace(tmp_pth, self.state_pth)
+            return result
+
+    def _entry(self, state: dict, resource: str) -> dict:
+        """Budget of resource, a new window starts after reset."""
+        entry = state.get(self._key(resource))
+        now = time.time()
+        if not entry or entry['reset'] <= now:
+            limit = DEFAULT_LIMITS.get((resource, self.has_token), 60)
+            entry = {'limit': limit, 'remaining': limit, 'reset': now + 3600,
+                     'reserved': (entry or {}).get('reserved', {})}
+            state[self._key(resource)] = entry
+        entry['reserved'] = {key: expires for key, expires in entry.get('reserved', {}).items() if expires > now}
+        return entry
+
+    def acquire(self, resource: str = 'core', priority: int = NORMAL) -> str:
+        """Reserves one request from budget, returns reservation that
+        observe() or release() gives back. Raises RateLimitPostponed if
+        remaining budget is reserved for more important requests."""
+        reservation = os.urandom(6).hex()
+
+        def take(state):
+            entry = self._entry(state, resource)
+            floor = int(entry['limit'] * RESERVE[priority])
+            if entry['remaining'] - len(entry['reserved']) <= floor:
+                raise RateLimitPostponed(resource, entry['reset'])
+            entry['reserved'][reservation] = time.time() + RESERVATION_TTL
+
+        self._update(take)
+        return reservation
+
+    def release(self, reservation: str, resource: str = 'core') -> None:
+        """Gives reservation back, for requests that got no response."""
+
+        def drop(state):
+            entry = state.get(self._key(resource))
+            if entry:
+                entry.get('reserved', {}).pop(reservation, None)
+
+        self._update(drop)
+
+    def observe(self, headers, resource: str = 'core', reservation: str = None) -> None:
+        """Updates budget from X-RateLimit-* headers of a response and
+        gives its reservation back. Server's remaining already counts
+        the request, or doesn't if it was a 304."""
+        if headers.get('X-RateLimit-Remaining') is None:
+            if reservation:
+                self.release(reservation, resource)
+            return
+        limit = int(headers.get('X-RateLimit-Limit', 0))
+        remaining = int(headers['X-RateLimit-Remaining'])
+        reset = float(headers.get('X-RateLimit-Reset', time.time() + 3600))
+
+        def store(state):
+            entry = state.get(self._key(resource)) or {}
+            reserved = entry.get('reserved', {})
+            reserved.pop(reservation, None)
+            state[self._key(resource)] = {'limit': limit, 'remaining': remaining,
+                                          'reset': reset, 'reserved': reserved}
+
+        self._update(store)
+
+    def status(self, resource: str = 'core') -> dict:
+        """Current limit, remaining and reset of resource."""
+        return dict(self._update(lambda state: self._entry(state, resource)))
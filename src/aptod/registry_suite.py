@@ -0,0 +1,164 @@
+"""
+App registry of Aptod.
+Built-in apps and user repo (aptod_repo.json) are merged once per
+process, and indexed by normalized name. Registry is rebuilt only
+when repo file changes on disk.
+"""
+
+import os
+import re
+import json
+import threading
+from urllib.parse import urlparse, unquote
+from pathlib import PurePosixPath
+
+from .file_suite import FileSuite
+from .data.default_apps import default_apps
+
+
+# Longest run of name tokens tried while matching a file name
+MAX_NAME_TOKENS = 4
+
+
+def normalize(name: str) -> str:
+    """Lowercase name without separators.
+    Exmp. Visual-Studio_Code > visualstudiocode"""
+    return re.sub(r'[^a-z0-9]', '', name.lower())
+
+
+def _source_of_url(url: str) -> dict:
+    """Source of a user repo app, from its github download url."""
+    parts = PurePosixPath(unquote(urlparse(url).path)).parts
+    source = {'type': 'url', 'url': url}
+    if 'github' in url and len(parts) > 2:
+        source.update({'owner': parts[1], 'repo': parts[2]})
+    return source
+
+
+class RegistrySuite:
+    """Name -> source registry of every available app."""
+
+    # Shared by every instance, rebuilt when repo file changes
+    _names = None
+    _sources = None
+    _index = None
+    _matches = None
+    _repos = None
+    _repo_stamp = None
+    _lock = threading.Lock()
+
+    def __init__(self):
+        self.repo_pth = FileSuite().repo_pth
+        self._refresh()
+
+    def _stamp(self):
+        try:
+            stat = os.stat(self.repo_pth)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _refresh(self) -> None:
+        """Rebuilds registry if it's not built yet or repo file changed."""
+        stamp = self._stamp()
+        if RegistrySuite._names is not None and stamp == RegistrySuite._repo_stamp:
+            return
+
+        with self._lock:
+            if RegistrySuite._names is not None and stamp == RegistrySuite._repo_stamp:
+                return
+
+            sources = {}
+            for app in default_apps:
+                if app['type'] == 'github':
+                    owner, repo = app['path'].split('/')[:2]
+                    sources[app['name']] = {'type': 'github', 'owner': owner, 'repo': repo}
+                else:
+                    sources[app['name']] = {'type': 'gitlab', 'projectId': app['projectId']}
+
+            repo_apps = {}
+            if stamp is not None:
+                try:
+                    with open(self.repo_pth, 'r', encoding="utf-8") as data_file:
+                        repo_apps = json.load(data_file)
+                except (OSError, json.decoder.JSONDecodeError):
+                    repo_apps = {}
+            for name, url in repo_apps.items():
+                # Built-in apps wins on same name, like before
+                sources.setdefault(name, _source_of_url(url))
+
+            # Exact name, lowercase and normalized name are aliases.
+            # First app wins, so built-in apps comes first.
+            index = {}
+            for name in sources:
+                for alias in (name, name.lower(), normalize(name)):
+                    index.setdefault(alias, name)
+
+            # Github owner/repo -> name, for AppImages that tell their repo
+            repos = {}
+            for name, source in sources.items():
+                if source.get('owner') and source.get('repo'):
+                    repos.setdefault(f"{source['owner']}/{source['repo']}".lower(), name)
+
+            RegistrySuite._sources = sources
+            RegistrySuite._index = index
+            RegistrySuite._repos = repos
+            RegistrySuite._matches = {}
+            RegistrySuite._names = list(sources)
+            RegistrySuite._repo_stamp = stamp
+
+    def names(self) -> list:
+        """Available app names, built-in apps first."""
+        self._refresh()
+        return list(self._names)
+
+    def resolve(self, name: str) -> str:
+        """Registry name of name, or '' if there is no such app."""
+        self._refresh()
+        return (self._index.get(name) or self._index.get(name.lower())
+                or self._index.get(normalize(name)) or '')
+
+    def source(self, name: str) -> dict:
+        """Where app comes from, None if app is unknown.
+        Github apps have owner and repo, gitlab apps have projectId,
+        user repo apps have url too."""
+        name = self.resolve(name)
+        return self._sources.get(name) if name else None
+
+    def match_update_info(self, update_info: dict) -> str:
+        """App name of embedded update information, or '' if its
+        repo isn't in registry."""
+        if not update_info or update_info.get('type') != 'github':
+            return ''
+        self._refresh()
+        return self._repos.get(f"{update_info['owner']}/{update_info['repo']}".lower(), '')
+
+    def match_file(self, file_name: str) -> str:
+        """App name of an appimage file name, or '' if none matches.
+        Exmp. tutanota-desktop-linux-3-106-5.appimage > tutanota"""
+        self._refresh()
+        matches = self._matches
+        if file_name in matches:
+            return matches[file_name]
+
+        # Runs of name tokens are looked up in index, longest first
+        tokens = re.findall(r'[a-z0-9]+', file_name.lower())
+        app = ''
+        for start in range(len(tokens)):
+            for end in range(min(len(tokens), start + MAX_NAME_TOKENS), start, -1):
+                app = self._index.get(''.join(tokens[start:end]), '')
+                if app:
+                    break
+            if app:
+                break
+
+        # Names inside a token (or with odd separators) needs substring search
+        if not app:
+            lower_name = file_name.lower()
+            for name in self._names:
+                if name.lower() in lower_name or name.lower().replace('-', '') in lower_name:
+                    app = name
+                    break
+
+        matches[file_name] = app
+        return app
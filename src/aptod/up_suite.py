@@ -2,7 +2,8 @@
 
 import os
 
-from .utils import downloader
+from .utils import downloader, zsync, checksum
+from .utils.appimage_info import appimage_info, version_key
 from .extract_suite import ExtractSuite
 
 class UpSuite:
@@ -18,16 +19,27 @@ class UpSuite:
         If there is a update returns app data
         that comes from extractor."""
 
-        app_list = self.extractor.get('all')
-        for app in app_list:
-            if app.lower() in app_path.lower() or app.lower().replace('-', '') in app_path.lower():
-                app_name = app
-                break
+        # Update information in AppImage tells its repo, file name is guessed
+        info = appimage_info(app_path)
+        update_info = info.get('update_info', {})
+        registry = self.extractor.registry
+        app_name = (registry.match_update_info(update_info) or
+                    registry.match_file(os.path.basename(app_path)) or registry.match_file(app_path))
 
         if app_name:
             app_data = self.extractor.get(app_name)
-            if app_data.get('Error'):
-                return app_data
+        elif update_info.get('type') == 'github':
+            # Not a known app, but it tells where its releases are
+            app_data = self.extractor.github_extractor(update_info['owner'], update_info['repo'])
+        else:
+            return {'Error': f'No repo has been found for {app_path}.'}
+        if app_data.get('Error'):
+            return app_data
+
+        # Same embedded version is up to date, even if file was renamed
+        installed_version = version_key(info.get('version'))
+        if installed_version and installed_version == version_key(app_data.get('version')):
+            return {}
 
         down_name = app_data.get('name')
 
@@ -37,16 +49,47 @@ class UpSuite:
             return {}
         return app_data
 
+    def delta_update(self, app_data: dict) -> bool:
+        """Builds new version from blocks of installed version
+        with .zsync file of release. Returns False if it's not
+        possible, so caller can download whole file."""
+
+        if not app_data.get('zsync_url') or not os.path.exists(app_data.get('app_cur_path', '')):
+            return False
+        # Without OpenSSL MD4 blocks are confirmed in pure python, around
+        # 1 MB/s, that is slower than downloading whole file
+        if not zsync.FAST_MD4:
+            return False
+
+        path = os.path.join(app_data['app_down_path'], app_data['name'])
+        print(f"Delta updating {app_data['name']}...")
+        try:
+            stats = zsync.delta_download(
+                app_data['zsync_url'], app_data['app_cur_path'], path,
+                expected_sha256=checksum.published_sha256(app_data))
+        except Exception as err:
+            print(f'Delta update failed ({err}), downloading whole file.')
+            return False
+
+        app_data['sha256'] = stats['sha256']
+        mb = 1024 * 1024
+        print(f"Delta update reused {stats['reused'] / mb:.1f} MB of "
+              f"{stats['length'] / mb:.1f} MB, downloaded {stats['downloaded'] / mb:.1f} MB.")
+        return True
+
     def update_app(self, app_data: dict):
         """Downloads new version of app,
         and deletes old version of app."""
 
         # Download app, if problems occur than remove
-        try:
-            downloader(app_data)
-        except Exception:
-            os.remove(app_data['app_down_path'])
-            raise
-        else:
-            # Everythinks looks fine so delete old app
-            os.remove(app_data['app_cur_path'])
+        if not self.delta_update(app_data):
+            path = os.path.join(app_data['app_down_path'], app_data['name'])
+            try:
+                downloader(app_data)
+            except Exception:
+                if os.path.exists(path):
+                    os.remove(path)
+                raise
+
+        # Everythinks looks fine so delete old app
+        os.remove(app_data['app_cur_path'])
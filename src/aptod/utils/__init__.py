@@ -3,14 +3,11 @@ Utils for Aptod.
 """
 import os
 import re
-import textwrap
-from string import ascii_letters
-from io import BytesIO
-
-from PIL import Image, ImageDraw, ImageFont
-import matplotlib.font_manager
-import requests
-from clint.textui import progress
+import hashlib
+
+from . import http_client, segmented, checksum
+from .store import DownloadStore
+from .stream_writer import StreamWriter, preallocate
 from .icon_handler import IconHandler
 
 
@@ -26,149 +23,197 @@ def is_valid_url(url: str):
     return False
 
 
-def downloader(app_data: dict, timeout=5):
+def downloader(app_data: dict, timeout=5, on_progress=None, segments=True):
     """Downloads file in given app data url
     to given app data path with progress bar.
-    Detects broken downloads and completes them."""
+    Detects broken downloads and completes them.
+    SHA-256 is computed while writing and checked against
+    published one, if release has it. If on_progress is given it's called with (done, total)
+    bytes instead of printing messages and progress bar.
+    Files downloaded before (to any path) are taken from local store.
+    With segments False file is downloaded with one connection."""
+    from clint.textui import progress
+
+    say = (lambda *args: None) if on_progress else print
 
     path = os.path.join(app_data["app_down_path"], app_data['name'])
     path_part = path + '.part'
     app_name = app_data['name']
     down_url = app_data["down_url"]
+    store = DownloadStore()
+
+    def from_store(**key) -> bool:
+        digest = store.fetch(path, **key)
+        if digest:
+            app_data['sha256'] = digest
+            # Broken download of same file isn't needed anymore
+            for leftover in (path_part, segmented.state_path(path_part)):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+            say(f' {app_name} is taken from local store.')
+            if on_progress:
+                size = os.path.getsize(path)
+                on_progress(size, size)
+        return bool(digest)
+
+    # With published digest store is asked before any download request
+    expected = checksum.published_sha256(app_data, timeout=timeout)
+    if expected and from_store(sha256=expected):
+        return
 
     # Request for url to get datas.
-    res = requests.get(down_url, stream=True, timeout=timeout)
+    res = http_client.get(down_url, stream=True, timeout=timeout)
     res.raise_for_status()
     # Two defination is required
     real_length =  int(res.headers.get('content-length'))
     total_length = int(res.headers.get('content-length'))
+    etag = res.headers.get('ETag')
+    url_key = store.url_key(down_url, real_length, etag)
+    sha256 = hashlib.sha256()
+
+    def finish():
+        """Checks digest, than removes .part on filename and keeps file in store.
+        Only files verified with published digest go to store."""
+        try:
+            app_data['sha256'] = checksum.verify(sha256, expected, path_part)
+        except checksum.ChecksumError:
+            os.remove(path_part)
+            raise
+        os.rename(path_part, path)
+        if expected:
+            store.add(path, app_data['sha256'], url_key)
 
     # Check file exist and not broken
     if os.path.exists(path):
         if total_length == os.path.getsize(path):
-            print(f' {app_name} already downloaded.')
+            res.close()
+            say(f' {app_name} already downloaded.')
+            if on_progress:
+                on_progress(total_length, total_length)
             return
 
-        os.rename(path, app_name + ".part")
+    # Same file from same url was downloaded before
+    if from_store(url_key=url_key, size=real_length):
+        res.close()
+        return
+
+    # Files hardlinked to store (and other installs) are complete files
+    # of another content, writing into them would change those too
+    for leftover in (path, path_part):
+        if os.path.exists(leftover) and os.stat(leftover).st_nlink > 1:
+            os.remove(leftover)
+
+    if os.path.exists(path):
+        os.rename(path, path_part)
+
+    # Big files are downloaded with multiple connections
+    if segments and segmented.can_segment(res, path_part, down_url):
+        res.close()
+        try:
+            if on_progress:
+                segmented.segmented_download(
+                    down_url, path_part, real_length, timeout=timeout,
+                    on_progress=lambda done: on_progress(done, real_length),
+                    hasher=sha256, say=say, etag=etag)
+            else:
+                print(f'Downloading {app_name}...')
+                with progress.Bar(expected_size=int(real_length / 1024) + 1) as bar:
+                    segmented.segmented_download(
+                        down_url, path_part, real_length, timeout=timeout,
+                        on_progress=lambda done: bar.show(int(done / 1024)), hasher=sha256, etag=etag)
+        except segmented.RangeNotSupported:
+            # Segments can't be continued, start over with one connection
+            say('Server doesn\'t take range requests, downloading whole file...')
+            for leftover in (path_part, segmented.state_path(path_part)):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+            downloader(app_data, timeout, on_progress, segments=False)
+            return
+        finish()
+        return
 
     # Check for broken downloads
-    elif os.path.exists(path_part):
+    if os.path.exists(path_part):
         missing = real_length - os.path.getsize(path_part)
-        if not missing:
-            os.rename(path_part, path)
-            print('App downloaded')
-            return
+        if missing <= 0:
+            # Full size .part without segment state can be a preallocated
+            # one whose process was killed, only published digest proves it's complete
+            checksum.update_from_file(sha256, path_part)
+            if expected and sha256.hexdigest() == expected:
+                res.close()
+                finish()
+                say('App downloaded')
+                return
+            say('.part can\'t be trusted, downloading again...')
+            os.remove(path_part)
+            sha256 = hashlib.sha256()
         # If missing equel to total_length
         # use r without header, otherwise this header throws error
         # missing should'nt be equel to total length
-        if missing != total_length:
-            res = requests.get(
+        elif missing != total_length:
+            # Release first connection back to pool before asking for range
+            res.close()
+            res = http_client.get(
                 down_url,
                 stream=True,
                 headers={"Range": f"bytes={os.path.getsize(path_part)}-"},
                 timeout=timeout)
             total_length = int(res.headers.get('content-length'))
             res.raise_for_status()
-            print('.part founded, continuing download...')
+            if res.status_code == 206:
+                say('.part founded, continuing download...')
+                # Digest continues from bytes already downloaded
+                checksum.update_from_file(sha256, path_part)
+            else:
+                # Server sent whole file, start over
+                total_length = real_length
+                os.remove(path_part)
 
     # Final part
-    with open(path_part, 'ab') as file:
-        print(f'Downloading {app_name}...')
-        for chunk in progress.bar(
-            res.iter_content(chunk_size=1024), expected_size=(total_length/1024) + 1
-        ):
-            if chunk:
-                file.write(chunk)
-                file.flush()
+    offset = real_length - total_length
+    say(f'Downloading {app_name}...')
+    bar = None
+    if not on_progress:
+        bar = progress.Bar(expected_size=int(real_length / 1024) + 1)
+
+    def report(written):
+        if on_progress:
+            on_progress(offset + written, real_length)
+        else:
+            bar.show(int((offset + written) / 1024))
+
+    # With range support .part is allocated in full size, so a full disk fails
+    # right away. Saved progress tells where data ends if process gets killed.
+    resumable = res.status_code == 206 or res.headers.get('accept-ranges', '').lower() == 'bytes'
+    checkpoint = None
+    if resumable:
+        checkpoint = lambda pos: segmented.save_progress(path_part, down_url, real_length, pos, etag)
+
+    fd = os.open(path_part, os.O_WRONLY | os.O_CREAT, 0o644)
+    writer = StreamWriter(fd, offset, hasher=sha256, on_progress=report, on_checkpoint=checkpoint)
+    try:
+        if resumable:
+            # State goes first, a killed process must never leave full
+            # size .part without it, or zeros after offset would look downloaded
+            checkpoint(offset)
+            preallocate(fd, offset, total_length)
+        with res:
+            writer.write_from(res, total_length)
+    finally:
+        # Drop unused preallocated space, .part ends where data ends
+        # and next try continues it by size like before.
+        os.ftruncate(fd, offset + writer.written)
+        os.close(fd)
+        if os.path.exists(segmented.state_path(path_part)):
+            os.remove(segmented.state_path(path_part))
+        if bar:
+            bar.done()
 
     # If all ok, remove .part on filename.
     if (os.path.exists(path_part) and
         real_length == os.path.getsize(path_part)):
-        os.rename(path_part, path)
-
-
+        finish()
 
 def get_icon(app_name: str) -> bytes:
-        """Find, create appImage icons."""
-
-        def create_icon(text) -> bytes:
-            """Creates logo for given text and
-            returns logo as bytes."""
-
-            longest_word = ''
-            for _ in text.split(' '):
-                if len(_) > len(longest_word):
-                    longest_word = _
-            font_size = 40 if len(longest_word) < 8 else (35 if len(longest_word) < 10 else 30)    
-        
-            text = f"{text}{10 * ' '}"
-            width, height = 200, 200
-            img = Image.new("RGB", (width, height), "#145DA0")
-
-            font_path = ''
-            for _ in matplotlib.font_manager.findSystemFonts(fontpaths=None, fontext='ttf'):
-                if 'quicksand-medium' in _.lower():
-                    font_path = _
-                    break    
-            font = ImageFont.truetype(font_path, font_size)   
-
-            avg_char_width = sum(font.getlength(char) for char in ascii_letters) / len(ascii_letters)
-            max_char_count = int( (img.size[0] * .95) / avg_char_width )
-            scaled_wrapped_text = textwrap.fill(text=text, width=max_char_count)
-            d = ImageDraw.Draw(img)
-            w, h = d.textbbox((0, 0), scaled_wrapped_text, font=font)[2:]
-        
-            d.text(
-                ((width-w)/2, (height-h)/2), align='center', text=scaled_wrapped_text, fill='white', font=font)
-            
-            with BytesIO() as output:        
-                img.save(output, 'PNG', quality=100)
-                image = output.getvalue()
-
-            return image
-
-        def is_content_image(headers: dict) -> bool:
-            """Simple content type image validator."""
-            image_formats = ["image/png", "image/jpeg", "image/jpg"]
-            content_type = ''
-            # For ignoring header case
-            for key in headers.keys():
-                if key.lower() == 'content-type':
-                    content_type = key
-                    break
-
-            if content_type and headers.get(content_type) in image_formats:
-                return True
-            return False
-
-        def find_icon(app_name: str) -> str:
-            """Try find appimage icon from base self.home_page."""
-            icon_url = ''
-            page_data = get_home_page_data()
-            for app_data in page_data:
-                if re.search(app_name, app_data['app_name'], re.IGNORECASE):
-                    icon_url = app_data['icon_url']
-                    break
-
-            return icon_url
-
-        
-        icon_url = find_icon(app_name)
-        if not icon_url:
-            return create_icon(app_name)
-
-        # Get image.
-        res = requests.get(icon_url, stream=True, timeout=5)
-        res.raise_for_status()
-
-        # Validate header content type belongs to image.
-        if not res.ok or is_content_image(res.headers) is False:
-            return create_icon(app_name)
-
-        # Last validator, after all.
-        try:
-            Image.open(BytesIO(res.content))
-        except UnidentifiedImageError:
-            return create_icon(app_name)
-
-        return res.content
+    """Find, create appImage icons."""
+    return IconHandler().get_icon(app_name)
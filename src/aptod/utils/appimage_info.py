@@ -0,0 +1,149 @@
+"""
+Identity and version of AppImage files.
+Update information that AppImages carry in their .upd_info ELF
+section (exmp. gh-releases-zsync|owner|repo|latest|App-*x86_64.AppImage.zsync)
+tells where app comes from, X-AppImage-Version of embedded desktop
+entry tells its version. Results are kept per (inode, mtime, size),
+so a file is read only once.
+"""
+
+import os
+import re
+import mmap
+import json
+import struct
+import threading
+
+from .squashfs import SquashFS, SquashfsError, parse_desktop_entry
+
+
+# Oldest entries are dropped above this count, old files are long gone
+MAX_ENTRIES = 1000
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _cache_path() -> str:
+    return os.path.join(os.path.expanduser('~'), '.config/aptod', 'appimage_info.json')
+
+
+def elf_section(data, name: str) -> bytes:
+    """Content of named ELF section, or b'' if there is no such section."""
+    if data[:4] != b'\x7fELF':
+        return b''
+    order = '<' if data[5] == 1 else '>'
+    if data[4] == 2:
+        shoff, = struct.unpack_from(order + 'Q', data, 0x28)
+        shentsize, shnum, shstrndx = struct.unpack_from(order + 'HHH', data, 0x3A)
+        header = order + '24xQQ'
+    else:
+        shoff, = struct.unpack_from(order + 'I', data, 0x20)
+        shentsize, shnum, shstrndx = struct.unpack_from(order + 'HHH', data, 0x2E)
+        header = order + '16xII'
+
+    def section(index):
+        return struct.unpack_from(header, data, shoff + index * shentsize)
+
+    names_offset, _ = section(shstrndx)
+    wanted = name.encode()
+    for index in range(shnum):
+        name_offset, = struct.unpack_from(order + 'I', data, shoff + index * shentsize)
+        start = names_offset + name_offset
+        if data[start:start + len(wanted) + 1] == wanted + b'\0':
+            offset, size = section(index)
+            return bytes(data[offset:offset + size])
+    return b''
+
+
+def parse_update_info(text: str) -> dict:
+    """Update information string as dictionary, {} if it's empty or unknown.
+    Exmp. gh-releases-zsync|owner|repo|latest|App-*.zsync >
+    {'type': 'github', 'owner': 'owner', 'repo': 'repo', 'tag': 'latest', 'pattern': 'App-*.zsync'}"""
+    parts = text.split('|')
+    if parts[0] == 'gh-releases-zsync' and len(parts) >= 4:
+        return {'type': 'github', 'owner': parts[1], 'repo': parts[2], 'tag': parts[3],
+                'pattern': parts[4] if len(parts) > 4 else ''}
+    if parts[0] == 'zsync' and len(parts) == 2:
+        return {'type': 'zsync', 'url': parts[1]}
+    return {}
+
+
+def read_info(path: str) -> dict:
+    """Update information and embedded version of AppImage at path."""
+    info = {}
+    with open(path, 'rb') as file:
+        try:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return info
+        with data:
+            try:
+                text = elf_section(data, '.upd_info').split(b'\0')[0].decode('utf-8', 'replace').strip()
+            except struct.error:
+                text = ''
+    if text:
+        info['update_info'] = parse_update_info(text)
+
+    try:
+        with SquashFS(path) as fs:
+            root = fs.listdir(fs.inode(fs.root_inode))
+            desktop = sorted(_ for _ in root if _.endswith('.desktop'))
+            if desktop:
+                entry = parse_desktop_entry(fs.read(desktop[0]).decode('utf-8', 'replace'))
+                if entry.get('X-AppImage-Version'):
+                    info['version'] = entry['X-AppImage-Version']
+    except (OSError, SquashfsError, struct.error, IndexError):
+        pass
+    return info
+
+
+def appimage_info(path: str) -> dict:
+    """Cached read_info(path). Cache key is inode, mtime and size,
+    so a replaced or changed file is read again."""
+    global _cache
+
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return {}
+    key = f'{stat.st_ino}:{stat.st_mtime_ns}:{stat.st_size}'
+
+    with _cache_lock:
+        if _cache is None:
+            try:
+                with open(_cache_path(), 'r', encoding="utf-8") as file:
+                    _cache = json.load(file)
+            except (OSError, json.decoder.JSONDecodeError):
+                _cache = {}
+        if key in _cache:
+            return dict(_cache[key])
+
+    try:
+        info = read_info(path)
+    except OSError:
+        return {}
+
+    with _cache_lock:
+        _cache[key] = info
+        # Dicts keep insertion order, oldest entries goes first
+        for old in list(_cache)[:-MAX_ENTRIES]:
+            del _cache[old]
+        try:
+            os.makedirs(os.path.dirname(_cache_path()), exist_ok=True)
+            tmp_pth = _cache_path() + '.tmp'
+            with open(tmp_pth, 'w', encoding="utf-8") as file:
+                json.dump(_cache, file)
+            os.replace(tmp_pth, _cache_path())
+        except OSError:
+            pass
+    return dict(info)
+
+
+def version_key(version: str) -> tuple:
+    """Comparable numbers of a version, trailing zeros ignored.
+    Exmp. v1.20.0 > (1, 20), continuous > ()"""
+    numbers = [int(_) for _ in re.findall(r'[0-9]+', version or '')]
+    while numbers and numbers[-1] == 0:
+        numbers.pop()
+    return tuple(numbers)
@@ -0,0 +1,96 @@
+"""
+SHA-256 checks of downloaded AppImages.
+Digest is computed while chunks are written, and compared with
+the one published with release (Github asset digest, SHA256SUMS
+like release files, or <asset>.sha256 files).
+"""
+
+import re
+from urllib.parse import unquote
+
+from . import http_client
+
+
+HEX_DIGEST = re.compile(r'^[0-9a-fA-F]{64}$')
+# BSD style lines, exmp. SHA256 (app.AppImage) = 9f86d08...
+BSD_LINE = re.compile(r'^SHA256 \((.+)\) = ([0-9a-fA-F]{64})$')
+# Release files that may include digest of an asset
+SUMS_FILE = re.compile(r'^(sha256sums?|checksums?)(\.txt|\.sha256)?$', re.IGNORECASE)
+
+
+class ChecksumError(ValueError):
+    """Downloaded file doesn't match published digest."""
+
+
+def checksum_files(asset_name: str, files: list) -> dict:
+    """Takes release files as (name, url) list. Returns checksum_url
+    of asset_name's own .sha256 file or release's SHA256SUMS file."""
+    own = {f'{asset_name}.sha256'.lower(), f'{asset_name}.sha256sum'.lower()}
+    sums_url = ''
+    for name, url in files:
+        if name.lower() in own:
+            return {'checksum_url': url}
+        if not sums_url and SUMS_FILE.match(name):
+            sums_url = url
+    return {'checksum_url': sums_url} if sums_url else {}
+
+
+def parse_digest(text: str, file_name: str) -> str:
+    """Finds file_name's SHA-256 in sha256sum or BSD style
+    checksum text. A file with only one digest is taken as is."""
+    digests = []
+    for line in text.splitlines():
+        line = line.strip()
+        bsd = BSD_LINE.match(line)
+        if bsd:
+            name, digest = bsd.groups()
+        else:
+            digest, _, name = line.partition(' ')
+            # Binary mode marker and paths, exmp. *dist/app.AppImage
+            name = name.strip().lstrip('*').split('/')[-1]
+        if not HEX_DIGEST.match(digest):
+            continue
+        if name == file_name:
+            return digest.lower()
+        digests.append((name, digest.lower()))
+
+    if len(digests) == 1 and not digests[0][0]:
+        return digests[0][1]
+    return ''
+
+
+def published_sha256(app_data: dict, timeout=5) -> str:
+    """Published SHA-256 of app_data's file, or '' if release has none.
+    Unreachable checksum files are ignored, digest is optional."""
+    digest = app_data.get('sha256') or ''
+    if digest:
+        return digest.lower().replace('sha256:', '')
+
+    if not app_data.get('checksum_url'):
+        return ''
+    try:
+        res = http_client.get(app_data['checksum_url'], timeout=timeout)
+        res.raise_for_status()
+    except OSError:
+        return ''
+    # app_data['name'] is renamed after version, checksum files list asset's own name
+    asset_name = app_data.get('asset_name') or unquote(app_data.get('down_url', '').rsplit('/', 1)[-1])
+    return parse_digest(res.text, asset_name or app_data['name'])
+
+
+def update_from_file(hasher, path: str) -> None:
+    """Feeds hasher with bytes already in path, used when
+    a download continues from a .part file."""
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b''):
+            hasher.update(chunk)
+
+
+def verify(hasher, expected: str, path_part: str) -> str:
+    """Returns hex digest, raises ChecksumError if it
+    doesn't match expected one."""
+    digest = hasher.hexdigest()
+    if expected and digest != expected:
+        raise ChecksumError(
+            f'Checksum mismatch for {path_part}: expected {expected}, got {digest}.')
+    return digest
@@ -0,0 +1,105 @@
+"""
+Process wide http client for Aptod.
+All network calls go through one pooled session, so
+connections to same hosts are reused between requests.
+"""
+
+import threading
+
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'aptod (+https://github.com/metebtg/aptod)',
+}
+
+# Can be changed with configure(), values comes from aptod.conf
+settings = {
+    'timeout': 5,
+    'pool_connections': 8,
+    'pool_maxsize': 16,
+    'retries': 3,
+    'backoff_factor': 0.5,
+}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def configure(**kwargs) -> None:
+    """Updates client settings. Session is rebuilt on next request."""
+    global _session
+
+    unknown = set(kwargs) - set(settings)
+    if unknown:
+        raise ValueError(f'Unknown http setting(s): {", ".join(unknown)}')
+
+    with _session_lock:
+        settings.update({k: v for k, v in kwargs.items() if v is not None})
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+def _build_session():
+    """Creates session with keep alive pools and retry policy."""
+    # requests is imported here, so cli starts without paying for it
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry = Retry(
+        total=settings['retries'],
+        backoff_factor=settings['backoff_factor'],
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=settings['pool_connections'],
+        pool_maxsize=settings['pool_maxsize'],
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.headers.update(DEFAULT_HEADERS)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session():
+    """Returns shared session, creates it on first call."""
+    global _session
+
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def request(method: str, url: str, **kwargs):
+    """Same as requests.request but uses shared session
+    and default timeout."""
+    kwargs.setdefault('timeout', settings['timeout'])
+    return get_session().request(method, url, **kwargs)
+
+
+def get(url: str, **kwargs):
+    """Shared session version of requests.get"""
+    return request('GET', url, **kwargs)
+
+
+def post(url: str, **kwargs):
+    """Shared session version of requests.post"""
+    return request('POST', url, **kwargs)
+
+
+def is_reachable(host: str = 'api.github.com', port: int = 443, timeout: float = 0.5) -> bool:
+    """Quick TCP check, tells if network is worth trying."""
+    import socket
+
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
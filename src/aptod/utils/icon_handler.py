@@ -4,36 +4,285 @@ Icon related module
 
 import os
 import re
+import json
+import time
+import shutil
+import threading
 import textwrap
+from functools import lru_cache
 from urllib.parse import urljoin
 from io import BytesIO
 from string import ascii_letters
 
-import requests
-from bs4 import BeautifulSoup
-from PIL import Image, ImageDraw, ImageFont, UnidentifiedImageError
-import matplotlib.font_manager
+from . import http_client
+
+# bs4, PIL, subprocess and concurrent.futures are slow to
+# import, they are imported inside methods that needs them.
+
+
+# appimage.github.io catalog is refreshed at most once in this period
+CATALOG_TTL = 24 * 60 * 60
+
+# Icon sizes of hicolor theme that desktops ask for
+ICON_SIZES = (16, 24, 32, 48, 64, 128, 256)
+# Installed icons are named aptod-<app>, so they don't clash with system ones
+ICON_PREFIX = 'aptod-'
+
+# Can be changed with configure(), values comes from aptod.conf
+settings = {
+    'catalog_url': 'https://appimage.github.io',
+}
+
+
+def configure(**kwargs) -> None:
+    """Updates icon catalog settings."""
+    unknown = set(kwargs) - set(settings)
+    if unknown:
+        raise ValueError(f'Unknown icon setting(s): {", ".join(unknown)}')
+    settings.update({k: v for k, v in kwargs.items() if v is not None})
+
+
+FONT_DIRS = (
+    '~/.local/share/fonts', '~/.fonts', '/usr/local/share/fonts', '/usr/share/fonts')
+# First font that includes one of these in its file name is used
+PREFERRED_FONTS = ('quicksand-medium', 'quicksand', 'dejavusans.', 'liberationsans-regular')
+
+
+def _system_fonts() -> list:
+    """Lists ttf font files, with fontconfig if it's available
+    otherwise by walking common font directories."""
+    if shutil.which('fc-list'):
+        import subprocess
+        try:
+            res = subprocess.run(
+                ['fc-list', '--format', '%{file}\n'],
+                capture_output=True, text=True, timeout=10, check=True)
+            return [_ for _ in res.stdout.splitlines() if _.lower().endswith('.ttf')]
+        except (OSError, subprocess.SubprocessError):
+            pass
+
+    fonts = []
+    for font_dir in FONT_DIRS:
+        for root, _, files in os.walk(os.path.expanduser(font_dir)):
+            fonts.extend(os.path.join(root, _) for _ in files if _.lower().endswith('.ttf'))
+    return fonts
+
+
+@lru_cache(maxsize=None)
+def find_font() -> str:
+    """Returns font path for created icons. Result is kept on disk,
+    system fonts are searched only when stored font is gone.
+    Empty string means no ttf font found."""
+    cache_pth = os.path.join(os.path.expanduser('~'), '.config/aptod', 'font_cache.json')
+    try:
+        with open(cache_pth, 'r', encoding="utf-8") as file:
+            font_path = json.load(file).get('font_path', '')
+        if font_path and os.path.exists(font_path):
+            return font_path
+    except (OSError, json.decoder.JSONDecodeError):
+        pass
+
+    fonts = _system_fonts()
+    font_path = ''
+    for preferred in PREFERRED_FONTS:
+        font_path = next((_ for _ in fonts if preferred in os.path.basename(_).lower()), '')
+        if font_path:
+            break
+    if not font_path and fonts:
+        font_path = sorted(fonts)[0]
+
+    if font_path:
+        os.makedirs(os.path.dirname(cache_pth), exist_ok=True)
+        with open(cache_pth, 'w', encoding="utf-8") as file:
+            json.dump({'font_path': font_path}, file)
+    return font_path
+
+
+@lru_cache(maxsize=None)
+def get_font(size: int):
+    """Returns font object in given size, created once per size."""
+    from PIL import ImageFont
+
+    font_path = find_font()
+    if font_path:
+        return ImageFont.truetype(font_path, size)
+    # Pillow's own font, when system doesn't have any ttf
+    return ImageFont.load_default(size)
+
+
+def _normalize(name: str) -> str:
+    """Catalog lookup key of app name."""
+    return re.sub(r'[^a-z0-9]', '', name.lower())
+
+
+def icon_theme_dir() -> str:
+    """User's hicolor icon theme folder."""
+    data_dir = os.environ.get('XDG_DATA_HOME') or os.path.join(os.path.expanduser('~'), '.local/share')
+    return os.path.join(data_dir, 'icons', 'hicolor')
+
+
+def _is_svg(image: bytes) -> bool:
+    return image[:512].lstrip().startswith(b'<') and b'<svg' in image[:4096]
 
 
 class IconHandler:
     """Find icons for appImage"""
+
+    # Parsed catalog is shared by every instance, loaded once per process
+    _catalog = None
+    _index: dict = {}
+    _matches: dict = {}
+    _lock = threading.Lock()
+    # App name -> future of its installed icon name
+    _icons: dict = {}
+    _icons_lock = threading.Lock()
+    _executor = None
+
     def __init__(self):
-        self.base_url = 'https://appimage.github.io'
+        self.base_url = settings['catalog_url']
         self.home_page = urljoin(self.base_url, '/apps')
+        self.catalog_pth = os.path.join(os.path.expanduser('~'), '.config/aptod', 'icon_catalog.json')
+        cache_dir = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+        self.icon_cache_dir = os.path.join(cache_dir, 'aptod', 'icons')
 
-    def _get_home_page(self, timeout: int=5) -> str:
-        """Request self.home_page and return as text."""
-        res = requests.get(self.home_page, timeout=timeout)
-        if res.ok:
-            return res.text
-        return ''
+    def prefetch(self, app_name: str):
+        """Starts getting icon of app in background, exmp. while app
+        downloads. Returns future of (image, found). Icon installed
+        before costs nothing, it's taken from cache."""
+        with self._icons_lock:
+            if IconHandler._executor is None:
+                from concurrent.futures import ThreadPoolExecutor
+                IconHandler._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='icons')
+            if app_name not in self._icons:
+                self._icons[app_name] = self._executor.submit(self._fetch_icon, app_name)
+            return self._icons[app_name]
 
-    def _get_home_page_data(self) -> list:
-        """Extract all appimage datas from home page."""
-        home_page = self._get_home_page()
+    def _take_prefetched(self, app_name: str):
+        """Removes prefetched future of app, so next install checks icon again."""
+        with self._icons_lock:
+            return self._icons.pop(app_name, None)
+
+    def _fetch_icon(self, app_name: str) -> tuple:
+        """Cached icon, catalog icon or generated one. found tells
+        if icon is worth caching."""
+        try:
+            with open(self.cache_path(app_name), 'rb') as file:
+                return file.read(), True
+        except OSError:
+            pass
+        try:
+            return self.get_icon(app_name), True
+        except (OSError, ValueError):
+            # Catalog or icon server is unreachable
+            return self.create_icon(app_name), False
 
-        if not home_page:
-            return []
+    def cache_path(self, app_name: str) -> str:
+        return os.path.join(self.icon_cache_dir, f'{app_name}.icon')
+
+    def _icon_paths(self, app_name: str, svg: bool = False) -> list:
+        theme_dir = icon_theme_dir()
+        if svg:
+            return [os.path.join(theme_dir, 'scalable', 'apps', f'{ICON_PREFIX}{app_name}.svg')]
+        return [os.path.join(theme_dir, f'{size}x{size}', 'apps', f'{ICON_PREFIX}{app_name}.png')
+                for size in ICON_SIZES]
+
+    def install_icon(self, app_name: str, image: bytes = None) -> tuple:
+        """Installs app icon into hicolor theme. Returns icon name and
+        True if theme files are changed. image is the icon shipped in
+        AppImage, without it prefetched icon is used (and waited only
+        if it isn't ready yet). If an image can't be read, next one is
+        used, generated icon is the last. Same icon is rendered only once."""
+        future = self._take_prefetched(app_name)
+        icon_name = ICON_PREFIX + app_name
+        cache_pth = self.cache_path(app_name)
+        try:
+            with open(cache_pth, 'rb') as file:
+                cached = file.read()
+        except OSError:
+            cached = None
+
+        for source in ('embedded', 'prefetched', 'generated'):
+            if source == 'embedded':
+                if image is None:
+                    continue
+                found = True
+            elif source == 'prefetched':
+                image, found = (future or self.prefetch(app_name)).result()
+                self._take_prefetched(app_name)
+            else:
+                image, found = self.create_icon(app_name), False
+
+            svg = _is_svg(image)
+            if image == cached and all(os.path.exists(_) for _ in self._icon_paths(app_name, svg)):
+                files = None
+                break
+            # Rendered before anything is removed, a broken image keeps old icon
+            try:
+                files = self._rendered(image, app_name)
+                break
+            except (OSError, ValueError):
+                continue
+
+        if source == 'embedded' and future:
+            future.cancel()
+        if files is None:
+            return icon_name, False
+
+        # Old icon in other format would be shown instead
+        self.remove_icon(app_name)
+        for path, content in files:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + '.tmp', 'wb') as file:
+                file.write(content)
+            os.replace(path + '.tmp', path)
+        if found:
+            os.makedirs(self.icon_cache_dir, exist_ok=True)
+            with open(cache_pth + '.tmp', 'wb') as file:
+                file.write(image)
+            os.replace(cache_pth + '.tmp', cache_pth)
+        return icon_name, True
+
+    def _rendered(self, image: bytes, app_name: str) -> list:
+        """(path, content) of icon files of image, SVG as is or PNG in
+        every ICON_SIZES keeping aspect ratio. Nothing is written.
+        Raises OSError (UnidentifiedImageError) if PIL can't read image."""
+        if _is_svg(image):
+            return [(self._icon_paths(app_name, svg=True)[0], image)]
+
+        from PIL import Image
+
+        files = []
+        with Image.open(BytesIO(image)) as source:
+            source = source.convert('RGBA')
+            for size, path in zip(ICON_SIZES, self._icon_paths(app_name)):
+                scale = size / max(source.size)
+                scaled = source.resize(
+                    (max(1, round(source.width * scale)), max(1, round(source.height * scale))),
+                    Image.LANCZOS)
+                icon = Image.new('RGBA', (size, size), (0, 0, 0, 0))
+                icon.paste(scaled, ((size - scaled.width) // 2, (size - scaled.height) // 2))
+
+                content = BytesIO()
+                icon.save(content, 'PNG')
+                files.append((path, content.getvalue()))
+        return files
+
+    def remove_icon(self, app_name: str, cached: bool = False) -> None:
+        """Removes installed icon of app, and cached one if cached is True."""
+        paths = self._icon_paths(app_name) + self._icon_paths(app_name, svg=True)
+        if cached:
+            paths.append(self.cache_path(app_name))
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _get_home_page(self, timeout: int=5, headers: dict = None):
+        """Request self.home_page and return response."""
+        return http_client.get(self.home_page, timeout=timeout, headers=headers)
+
+    def _parse_home_page(self, home_page: str) -> list:
+        """Extract all appimage datas from home page."""
+        from bs4 import BeautifulSoup
 
         soup = BeautifulSoup(home_page, 'html.parser')
         tbody = soup.find('tbody')
@@ -52,24 +301,93 @@ class IconHandler:
 
         return page_data
 
+    def _read_catalog(self) -> dict:
+        """Returns catalog stored on disk."""
+        try:
+            with open(self.catalog_pth, 'r', encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, json.decoder.JSONDecodeError):
+            return {}
+
+    def _save_catalog(self, catalog: dict) -> None:
+        os.makedirs(os.path.dirname(self.catalog_pth), exist_ok=True)
+        tmp_pth = self.catalog_pth + '.tmp'
+        with open(tmp_pth, 'w', encoding="utf-8") as file:
+            json.dump(catalog, file)
+        os.replace(tmp_pth, self.catalog_pth)
+
+    def _load_catalog(self) -> list:
+        """Returns stored catalog, refreshes it if older than
+        CATALOG_TTL. Unchanged page costs only a 304."""
+        catalog = self._read_catalog()
+        if catalog and time.time() - catalog.get('fetched_at', 0) < CATALOG_TTL:
+            return catalog['apps']
+
+        headers = {}
+        if catalog.get('etag'):
+            headers['If-None-Match'] = catalog['etag']
+        if catalog.get('last_modified'):
+            headers['If-Modified-Since'] = catalog['last_modified']
+
+        try:
+            res = self._get_home_page(headers=headers)
+        except OSError:
+            # Old catalog is better than nothing while offline
+            return catalog.get('apps', [])
+
+        if res.status_code == 304 and catalog:
+            catalog['fetched_at'] = time.time()
+        elif res.ok:
+            catalog = {
+                'etag': res.headers.get('ETag'),
+                'last_modified': res.headers.get('Last-Modified'),
+                'fetched_at': time.time(),
+                'apps': self._parse_home_page(res.text),
+            }
+        else:
+            return catalog.get('apps', [])
+
+        self._save_catalog(catalog)
+        return catalog['apps']
+
+    def _get_home_page_data(self) -> list:
+        """Returns all appimage datas of home page, with
+        normalized name index built once per process."""
+        with self._lock:
+            if IconHandler._catalog is None:
+                catalog = self._load_catalog()
+                index = {}
+                for app_data in catalog:
+                    # appimage.github.io uses placeholder icons for some
+                    if 'placeholder' in app_data['icon_url']:
+                        continue
+                    index.setdefault(_normalize(app_data['app_name']), app_data)
+                IconHandler._index = index
+                IconHandler._catalog = catalog
+        return IconHandler._catalog
+
     def _find_icon(self, app_name: str) -> str:
         """Try find appimage icon from base self.home_page."""
-        icon_url = ''
-        page_data = self._get_home_page_data()
-        for app_data in page_data:
+        self._get_home_page_data()
 
-            # appimage.github.io uses placeholder icons for some
-            if 'placeholder' in app_data['icon_url']:
-                continue
+        app_data = self._index.get(_normalize(app_name))
+        if app_data:
+            return app_data['icon_url']
 
-            if re.search(app_name, app_data['app_name'], re.IGNORECASE):
-                icon_url = app_data['icon_url']
-                break
+        # Not exact name, first app that includes name. Searched once per name.
+        if app_name not in self._matches:
+            icon_url = ''
+            for app_data in self._index.values():
+                if re.search(re.escape(app_name), app_data['app_name'], re.IGNORECASE):
+                    icon_url = app_data['icon_url']
+                    break
+            self._matches[app_name] = icon_url
 
-        return icon_url
+        return self._matches[app_name]
 
     def get_icon(self, app_name: str) -> bytes:
         """If finds image than returns as byte otherwise None."""
+        from PIL import Image, UnidentifiedImageError
 
         def is_content_image(headers: dict) -> bool:
             """Simple content type image validator."""
@@ -91,7 +409,7 @@ class IconHandler:
             return self.create_icon(app_name)
       
         # Get image.
-        res = requests.get(icon_url, stream=True, timeout=5)
+        res = http_client.get(icon_url)
         res.raise_for_status()
 
         # Validate header content type belongs to image.
@@ -109,6 +427,7 @@ class IconHandler:
     def create_icon(self, text) -> bytes:
         """Creates logo for given text and
         returns logo as bytes."""
+        from PIL import Image, ImageDraw
 
         longest_word = ''
         for _ in text.split(' '):
@@ -120,12 +439,7 @@ class IconHandler:
         width, height = 200, 200
         img = Image.new("RGB", (width, height), "#145DA0")
 
-        font_path = ''
-        for _ in matplotlib.font_manager.findSystemFonts(fontpaths=None, fontext='ttf'):
-            if 'quicksand-medium' in _.lower():
-                font_path = _
-                break    
-        font = ImageFont.truetype(font_path, font_size)   
+        font = get_font(font_size)
 
         avg_char_width = sum(font.getlength(char) for char in ascii_letters) / len(ascii_letters)
         max_char_count = int( (img.size[0] * .95) / avg_char_width )
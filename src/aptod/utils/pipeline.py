@@ -0,0 +1,175 @@
+"""
+Staged pipeline for batch operations.
+Every stage has its own worker threads and a bounded input queue,
+so while one app downloads the next one is resolved and the
+previous one is integrated to desktop.
+"""
+
+import sys
+import time
+import queue
+import threading
+
+
+class StageError(Exception):
+    """Raised by a stage to stop an item with a clean message."""
+
+
+class Stage:
+    """One step of pipeline. func takes item's current value
+    and returns value for next stage."""
+
+    def __init__(self, name: str, func, workers: int = 1):
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+
+
+def run_pipeline(items: list, stages: list, queue_size: int = 2, on_stage=None) -> tuple:
+    """Runs every item through stages. on_stage(index, stage_name) is
+    called when an item enters a stage. Returns results in item order
+    as (value, error) tuples and per stage timings as
+    name -> {'count', 'busy', 'start', 'end'}. Failed items skip
+    remaining stages."""
+
+    results = [(None, None)] * len(items)
+    timings = {stage.name: {'count': 0, 'busy': 0.0, 'start': None, 'end': None} for stage in stages}
+    timing_lock = threading.Lock()
+    done = object()
+
+    # First queue is filled up front, others are bounded so a fast
+    # stage can't get far ahead of a slow one.
+    queues = [queue.Queue()] + [queue.Queue(maxsize=queue_size) for _ in stages[1:]]
+    for index, item in enumerate(items):
+        queues[0].put((index, item))
+
+    def worker(stage_no: int, stage: Stage):
+        in_queue = queues[stage_no]
+        out_queue = queues[stage_no + 1] if stage_no + 1 < len(stages) else None
+        timing = timings[stage.name]
+        while True:
+            job = in_queue.get()
+            if job is done:
+                return
+            index, value = job
+            if on_stage:
+                on_stage(index, stage.name)
+
+            start = time.monotonic()
+            try:
+                value, error = stage.func(value), None
+            except StageError as err:
+                error = str(err)
+            except Exception as err:
+                error = f'{stage.name} failed: {err}'
+            end = time.monotonic()
+
+            with timing_lock:
+                timing['count'] += 1
+                timing['busy'] += end - start
+                timing['start'] = start if timing['start'] is None else min(timing['start'], start)
+                timing['end'] = end if timing['end'] is None else max(timing['end'], end)
+
+            if error is None and out_queue is not None:
+                out_queue.put((index, value))
+            else:
+                results[index] = (value if error is None else None, error)
+
+    groups = []
+    for stage_no, stage in enumerate(stages):
+        threads = [
+            threading.Thread(target=worker, args=(stage_no, stage), daemon=True)
+            for _ in range(stage.workers)
+        ]
+        for thread in threads:
+            thread.start()
+        groups.append(threads)
+
+    # Stages are closed in order, after all workers of previous stage finished
+    for stage_no, threads in enumerate(groups):
+        for _ in threads:
+            queues[stage_no].put(done)
+        for thread in threads:
+            thread.join()
+
+    return results, timings
+
+
+def format_timings(timings: dict, wall: float) -> str:
+    """Summary table of run_pipeline timings."""
+    lines = [f"{'stage':<12}{'apps':>6}{'busy s':>10}{'wall s':>10}"]
+    busy_total = 0.0
+    for name, timing in timings.items():
+        span = (timing['end'] - timing['start']) if timing['start'] is not None else 0.0
+        busy_total += timing['busy']
+        lines.append(f"{name:<12}{timing['count']:>6}{timing['busy']:>10.2f}{span:>10.2f}")
+    lines.append(f"Finished in {wall:.2f} s, stages were busy for {busy_total:.2f} s in total.")
+    return '\n'.join(lines)
+
+
+class MultiBar:
+    """One progress line per item, redrawn in place. When output
+    is not a terminal only stage changes are printed."""
+
+    def __init__(self, names: list, stream=None, interval: float = 0.1, width: int = 24):
+        self.stream = stream or sys.stdout
+        self.interval = interval
+        self.width = width
+        self.names = names
+        self.states = [{'stage': 'waiting', 'done': 0, 'total': 0} for _ in names]
+        self.tty = self.stream.isatty()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._drawn = 0
+
+    def __enter__(self):
+        if self.tty:
+            self._thread = threading.Thread(target=self._loop, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self._draw()
+
+    def update(self, index: int, stage: str = None, done: int = None, total: int = None) -> None:
+        """Updates stage and/or downloaded bytes of item at index."""
+        with self._lock:
+            state = self.states[index]
+            changed = stage is not None and stage != state['stage']
+            if stage is not None:
+                state['stage'] = stage
+            if done is not None:
+                state['done'] = done
+            if total is not None:
+                state['total'] = total
+        if changed and not self.tty:
+            self.stream.write(f'{self.names[index]}: {stage}\n')
+            self.stream.flush()
+
+    def _line(self, name: str, state: dict, name_width: int) -> str:
+        total, done = state['total'], state['done']
+        ratio = min(done / total, 1.0) if total else 0.0
+        filled = int(ratio * self.width)
+        bar = '#' * filled + '-' * (self.width - filled)
+        size = f'{done / 1048576:6.1f}/{total / 1048576:.1f} MB' if total else ''
+        return f"{name:<{name_width}} [{bar}] {ratio * 100:3.0f}% {size:<18} {state['stage']}"
+
+    def _draw(self) -> None:
+        if not self.tty:
+            return
+        with self._lock:
+            name_width = max((len(name) for name in self.names), default=0)
+            lines = [self._line(name, state, name_width) for name, state in zip(self.names, self.states)]
+        # Move back to first line of previous draw and overwrite
+        prefix = f'\x1b[{self._drawn}F' if self._drawn else ''
+        self.stream.write(prefix + ''.join(f'\x1b[K{line}\n' for line in lines))
+        self.stream.flush()
+        self._drawn = len(lines)
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            self._draw()
@@ -0,0 +1,215 @@
+"""
+Segmented downloads for big AppImages.
+File is split into byte ranges, each range is downloaded with
+its own connection and written to .part file with positional
+writes. Progress of every segment is kept next to .part file,
+so broken downloads continue from where each segment stopped.
+"""
+
+import os
+import json
+import time
+import threading
+
+from . import http_client
+
+
+# Can be changed with configure(), values comes from aptod.conf or cli
+settings = {
+    'connections': 4,
+    # Smaller files are downloaded with single connection
+    'min_size': 16 * 1024 * 1024,
+}
+
+
+def configure(**kwargs) -> None:
+    """Updates segmented download settings."""
+    unknown = set(kwargs) - set(settings)
+    if unknown:
+        raise ValueError(f'Unknown download setting(s): {", ".join(unknown)}')
+    settings.update({k: v for k, v in kwargs.items() if v is not None})
+
+
+class RangeNotSupported(ValueError):
+    """Server answered a range request with whole file."""
+
+
+def state_path(path_part: str) -> str:
+    """Segment state file of .part file."""
+    return path_part + '.segments'
+
+
+def _takes_ranges(res) -> bool:
+    return res.headers.get('accept-ranges', '').lower() == 'bytes'
+
+
+def can_segment(res, path_part: str, down_url: str) -> bool:
+    """True if download of res should be (or was) segmented. Saved
+    state is dropped with its .part if file changed (size or ETag)
+    or server doesn't take ranges anymore."""
+    length = int(res.headers.get('content-length') or 0)
+    if os.path.exists(state_path(path_part)):
+        # Started segmented before, continue that way
+        if _takes_ranges(res) and _load_state(path_part, down_url, length, res.headers.get('ETag')):
+            return True
+        os.remove(state_path(path_part))
+        if os.path.exists(path_part):
+            os.remove(path_part)
+    if settings['connections'] < 2 or os.path.exists(path_part):
+        return False
+    return _takes_ranges(res) and length >= settings['min_size']
+
+
+def _split(length: int, count: int) -> list:
+    """Splits length bytes into count segments."""
+    size = -(-length // count)
+    return [
+        {'start': start, 'end': min(start + size, length) - 1, 'pos': start}
+        for start in range(0, length, size)
+    ]
+
+
+def _load_state(path_part: str, down_url: str, length: int, etag: str = None) -> list:
+    """Returns saved segments if they belong to same file."""
+    try:
+        with open(state_path(path_part), 'r', encoding="utf-8") as file:
+            state = json.load(file)
+    except (OSError, json.decoder.JSONDecodeError):
+        return []
+
+    # Same sized file may be uploaded again, ETag tells it
+    if (state.get('url') != down_url or state.get('length') != length or
+            state.get('etag') != etag or not os.path.exists(path_part) or
+            os.path.getsize(path_part) != length):
+        return []
+    return state['segments']
+
+
+def _save_state(path_part: str, down_url: str, length: int, segments: list, etag: str = None) -> None:
+    tmp_pth = state_path(path_part) + '.tmp'
+    with open(tmp_pth, 'w', encoding="utf-8") as file:
+        json.dump({'url': down_url, 'length': length, 'etag': etag, 'segments': segments}, file)
+    os.replace(tmp_pth, state_path(path_part))
+
+
+def _contiguous_end(segments: list) -> int:
+    """End of bytes written without a gap from start of file."""
+    for segment in segments:
+        if segment['pos'] <= segment['end']:
+            return segment['pos']
+    return segments[-1]['end'] + 1
+
+
+def _hash_until(read_fd: int, hasher, frontier: int, end: int) -> int:
+    """Feeds hasher with bytes between frontier and end, returns new frontier.
+    Those bytes were just written, so they are read from page cache."""
+    while frontier < end:
+        chunk = os.pread(read_fd, min(1024 * 1024, end - frontier), frontier)
+        if not chunk:
+            break
+        hasher.update(chunk)
+        frontier += len(chunk)
+    return frontier
+
+
+def save_progress(path_part: str, down_url: str, length: int, pos: int, etag: str = None) -> None:
+    """Saves progress of a single connection download into preallocated
+    .part file as one segment, so it continues from pos."""
+    _save_state(path_part, down_url, length, [{'start': 0, 'end': length - 1, 'pos': pos}], etag)
+
+
+def segmented_download(down_url: str, path_part: str, length: int, timeout=5,
+                       on_progress=None, hasher=None, say=print, etag: str = None) -> None:
+    """Downloads down_url into path_part with settings['connections']
+    parallel range requests. on_progress is called with downloaded
+    byte count from the calling thread. If hasher is given, it's fed
+    with file in order while segments are still downloading. Messages
+    go to say. Raises if any segment fails, finished segments are kept
+    for next try. Raises RangeNotSupported if server sends whole file
+    for a range, caller should download it with one connection."""
+
+    segments = _load_state(path_part, down_url, length, etag)
+    if segments:
+        say('.part found, continuing segmented download...')
+    else:
+        segments = _split(length, settings['connections'])
+        # Sparse file in full size, segments fills their own ranges
+        with open(path_part, 'wb') as file:
+            file.truncate(length)
+        _save_state(path_part, down_url, length, segments, etag)
+
+    errors = []
+    stop = threading.Event()
+    fd = os.open(path_part, os.O_WRONLY)
+    read_fd = os.open(path_part, os.O_RDONLY) if hasher is not None else None
+    frontier = 0
+
+    def fetch(segment: dict) -> None:
+        tries = 0
+        while segment['pos'] <= segment['end'] and not stop.is_set():
+            try:
+                res = http_client.get(
+                    down_url,
+                    stream=True,
+                    headers={'Range': f"bytes={segment['pos']}-{segment['end']}"},
+                    timeout=timeout)
+                res.raise_for_status()
+                if res.status_code != 206:
+                    res.close()
+                    errors.append(RangeNotSupported(f'Server ignored range request for {down_url}'))
+                    stop.set()
+                    return
+                with res:
+                    for chunk in res.iter_content(chunk_size=64 * 1024):
+                        if stop.is_set():
+                            return
+                        # Server may send more than asked, never write over next segment
+                        chunk = chunk[:segment['end'] + 1 - segment['pos']]
+                        os.pwrite(fd, chunk, segment['pos'])
+                        segment['pos'] += len(chunk)
+                        if segment['pos'] > segment['end']:
+                            break
+            except Exception as err:
+                tries += 1
+                if tries > 3:
+                    errors.append(err)
+                    return
+                time.sleep(tries)
+
+    threads = [
+        threading.Thread(target=fetch, args=(segment,), daemon=True)
+        for segment in segments if segment['pos'] <= segment['end']
+    ]
+    try:
+        for thread in threads:
+            thread.start()
+
+        last_save = time.monotonic()
+        while any(thread.is_alive() for thread in threads):
+            time.sleep(0.2)
+            if on_progress:
+                on_progress(sum(s['pos'] - s['start'] for s in segments))
+            if hasher is not None:
+                frontier = _hash_until(read_fd, hasher, frontier, _contiguous_end(segments))
+            if time.monotonic() - last_save > 1:
+                _save_state(path_part, down_url, length, segments, etag)
+                last_save = time.monotonic()
+
+        if hasher is not None and not errors:
+            # Only the tail written after last check is left
+            _hash_until(read_fd, hasher, frontier, length)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+        os.close(fd)
+        if read_fd is not None:
+            os.close(read_fd)
+        _save_state(path_part, down_url, length, segments, etag)
+
+    if errors:
+        raise errors[0]
+
+    if on_progress:
+        on_progress(length)
+    os.remove(state_path(path_part))
@@ -0,0 +1,305 @@
+"""
+Pure Python squashfs reader for AppImages.
+Type 2 AppImages are an ELF runtime followed by a squashfs image.
+Image is mmap'ed and only superblock, needed metadata blocks and data
+blocks of read files are decompressed, so icon and .desktop entry of an
+app are read in milliseconds without extracting it.
+"""
+
+import mmap
+import zlib
+import struct
+import posixpath
+
+
+SQUASHFS_MAGIC = b'hsqs'
+# Compression ids of superblock
+GZIP, LZMA, LZO, XZ, LZ4, ZSTD = 1, 2, 3, 4, 5, 6
+
+NO_FRAGMENT = 0xFFFFFFFF
+# Size fields with this bit are stored uncompressed
+METADATA_UNCOMPRESSED = 1 << 15
+DATA_UNCOMPRESSED = 1 << 24
+METADATA_SIZE = 8192
+
+BASIC_DIR, BASIC_FILE, BASIC_SYMLINK = 1, 2, 3
+EXT_DIR, EXT_FILE, EXT_SYMLINK = 8, 9, 10
+
+# Bigger files are not read, icons and .desktop files are small
+MAX_READ = 16 * 1024 * 1024
+MAX_SYMLINKS = 10
+
+
+class SquashfsError(ValueError):
+    """File is not a readable squashfs image (or AppImage)."""
+
+
+def elf_size(data) -> int:
+    """End of ELF file in data, where AppImage's squashfs starts.
+    Section header table is last part of the runtime."""
+    if data[:4] != b'\x7fELF':
+        raise SquashfsError('Not an ELF file.')
+    order = '<' if data[5] == 1 else '>'
+    if data[4] == 2:
+        shoff, = struct.unpack_from(order + 'Q', data, 0x28)
+        shentsize, shnum = struct.unpack_from(order + 'HH', data, 0x3A)
+    else:
+        shoff, = struct.unpack_from(order + 'I', data, 0x20)
+        shentsize, shnum = struct.unpack_from(order + 'HH', data, 0x2E)
+    return shoff + shentsize * shnum
+
+
+def _decompressor(compression: int):
+    """Decompress function of compression id. zstd needs Python 3.14
+    or zstandard package, others are in standard library."""
+    if compression == GZIP:
+        return zlib.decompress
+    if compression in (XZ, LZMA):
+        import lzma
+        return lzma.decompress
+    if compression == ZSTD:
+        try:
+            from compression import zstd
+            return zstd.decompress
+        except ImportError:
+            pass
+        try:
+            import zstandard
+        except ImportError as err:
+            raise SquashfsError('zstd compressed image needs zstandard package.') from err
+        return lambda data: zstandard.ZstdDecompressor().decompress(data, max_output_size=1 << 20)
+    raise SquashfsError(f'Unsupported squashfs compression ({compression}).')
+
+
+class _Cursor:
+    """Reads a metadata table as one stream, from block and offset."""
+
+    def __init__(self, fs, block: int, offset: int):
+        self.fs = fs
+        self.block = block
+        self.data = fs.metadata_block(block)[0]
+        self.offset = offset
+
+    def read(self, length: int) -> bytes:
+        chunks = []
+        while length:
+            if self.offset >= len(self.data):
+                self.block = self.fs.metadata_block(self.block)[1]
+                self.data, self.offset = self.fs.metadata_block(self.block)[0], 0
+            chunk = self.data[self.offset:self.offset + length]
+            self.offset += len(chunk)
+            length -= len(chunk)
+            chunks.append(chunk)
+        return b''.join(chunks)
+
+    def unpack(self, fmt: str) -> tuple:
+        return struct.unpack('<' + fmt, self.read(struct.calcsize('<' + fmt)))
+
+
+class SquashFS:
+    """Read only squashfs 4.0 image, at offset of file or after
+    AppImage runtime if offset isn't given."""
+
+    def __init__(self, path: str, offset: int = None):
+        self.file = open(path, 'rb')
+        try:
+            self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError as err:
+            self.file.close()
+            raise SquashfsError('Empty file.') from err
+        try:
+            self.offset = elf_size(self.data) if offset is None else offset
+            self._read_superblock()
+        except (SquashfsError, struct.error) as err:
+            self.close()
+            raise SquashfsError(f'No squashfs image in {path}: {err}') from err
+        self._metadata = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self) -> None:
+        self.data.close()
+        self.file.close()
+
+    def _read_superblock(self) -> None:
+        if self.data[self.offset:self.offset + 4] != SQUASHFS_MAGIC:
+            raise SquashfsError('Bad magic.')
+        fields = struct.unpack_from('<4sIIIIHHHHHHQQQQQQQQ', self.data, self.offset)
+        self.block_size, compression, major = fields[3], fields[5], fields[9]
+        self.root_inode = fields[11]
+        self.inode_table, self.dir_table, self.fragment_table = fields[15:18]
+        if major != 4:
+            raise SquashfsError(f'Unsupported squashfs version {major}.')
+        self._decompress = _decompressor(compression)
+
+    def decompress(self, raw: bytes) -> bytes:
+        try:
+            return self._decompress(raw)
+        except Exception as err:
+            # zlib, lzma and zstd have their own error types
+            raise SquashfsError(f'Broken block: {err}') from err
+
+    def metadata_block(self, pos: int) -> tuple:
+        """Decompressed metadata block at pos (from image start),
+        and position of next block."""
+        if pos not in self._metadata:
+            start = self.offset + pos
+            header, = struct.unpack_from('<H', self.data, start)
+            size = header & ~METADATA_UNCOMPRESSED
+            raw = self.data[start + 2:start + 2 + size]
+            block = raw if header & METADATA_UNCOMPRESSED else self.decompress(raw)
+            self._metadata[pos] = (block, pos + 2 + size)
+        return self._metadata[pos]
+
+    def inode(self, ref: int) -> dict:
+        """Inode of reference, block in inode table << 16 | offset."""
+        cursor = _Cursor(self, self.inode_table + (ref >> 16), ref & 0xFFFF)
+        kind, mode, _, _, mtime, number = cursor.unpack('HHHHII')
+        inode = {'type': kind, 'mode': mode, 'mtime': mtime, 'number': number}
+
+        if kind == BASIC_DIR:
+            block, _, size, offset, _ = cursor.unpack('IIHHI')
+            inode.update(block=block, size=size, offset=offset)
+        elif kind == EXT_DIR:
+            _, size, block, _, _, offset, _ = cursor.unpack('IIIIHHI')
+            inode.update(block=block, size=size, offset=offset)
+        elif kind in (BASIC_FILE, EXT_FILE):
+            if kind == BASIC_FILE:
+                start, fragment, offset, size = cursor.unpack('IIII')
+            else:
+                start, size, _, _, fragment, offset, _ = cursor.unpack('QQQIIII')
+            count = size // self.block_size
+            if fragment == NO_FRAGMENT and size % self.block_size:
+                count += 1
+            inode.update(start=start, size=size, fragment=fragment, frag_offset=offset,
+                         blocks=cursor.unpack(f'{count}I') if count else ())
+        elif kind in (BASIC_SYMLINK, EXT_SYMLINK):
+            _, length = cursor.unpack('II')
+            inode['target'] = cursor.read(length).decode('utf-8', 'surrogateescape')
+        return inode
+
+    def listdir(self, inode: dict) -> dict:
+        """Entry name -> inode reference of directory inode."""
+        if inode['type'] not in (BASIC_DIR, EXT_DIR):
+            raise SquashfsError('Not a directory.')
+        entries = {}
+        # Size includes 3 bytes for . and .. entries, which aren't stored
+        remaining = inode['size'] - 3
+        cursor = _Cursor(self, self.dir_table + inode['block'], inode['offset'])
+        while remaining > 0:
+            count, start, _ = cursor.unpack('III')
+            remaining -= 12
+            for _ in range(count + 1):
+                offset, _, _, name_size = cursor.unpack('HhHH')
+                name = cursor.read(name_size + 1).decode('utf-8', 'surrogateescape')
+                entries[name] = (start << 16) | offset
+                remaining -= 8 + name_size + 1
+        return entries
+
+    def lookup(self, path: str, _depth: int = 0) -> dict:
+        """Inode of path, symlinks are followed."""
+        if _depth > MAX_SYMLINKS:
+            raise SquashfsError(f'Too many symlinks in {path}.')
+        inode, parents = self.inode(self.root_inode), []
+        parts = [_ for _ in path.split('/') if _ not in ('', '.')]
+        for index, part in enumerate(parts):
+            if part == '..':
+                parents = parents[:-1]
+                inode = self.lookup('/'.join(parents), _depth)
+                continue
+            ref = self.listdir(inode).get(part)
+            if ref is None:
+                raise SquashfsError(f'{path} not found.')
+            inode = self.inode(ref)
+            if inode['type'] in (BASIC_SYMLINK, EXT_SYMLINK):
+                target = inode['target']
+                base = '' if target.startswith('/') else '/'.join(parents)
+                rest = '/'.join(parts[index + 1:])
+                return self.lookup(posixpath.join(base, target, rest).rstrip('/'), _depth + 1)
+            parents.append(part)
+        return inode
+
+    def _data_block(self, pos: int, size: int) -> bytes:
+        raw = self.data[self.offset + pos:self.offset + pos + (size & ~DATA_UNCOMPRESSED)]
+        return raw if size & DATA_UNCOMPRESSED else self.decompress(raw)
+
+    def _fragment(self, index: int) -> bytes:
+        """Fragment block, tails of small files are kept together in them."""
+        per_block = METADATA_SIZE // 16
+        pointer, = struct.unpack_from(
+            '<Q', self.data, self.offset + self.fragment_table + (index // per_block) * 8)
+        cursor = _Cursor(self, pointer, (index % per_block) * 16)
+        start, size, _ = cursor.unpack('QII')
+        return self._data_block(start, size)
+
+    def read(self, path: str) -> bytes:
+        """Content of a file in image."""
+        inode = self.lookup(path)
+        if inode['type'] not in (BASIC_FILE, EXT_FILE):
+            raise SquashfsError(f'{path} is not a file.')
+        if inode['size'] > MAX_READ:
+            raise SquashfsError(f'{path} is too big.')
+
+        chunks, pos = [], inode['start']
+        for size in inode['blocks']:
+            if size & ~DATA_UNCOMPRESSED == 0:
+                # Sparse block
+                chunks.append(bytes(self.block_size))
+                continue
+            chunks.append(self._data_block(pos, size))
+            pos += size & ~DATA_UNCOMPRESSED
+        if inode['fragment'] != NO_FRAGMENT:
+            tail = inode['size'] % self.block_size
+            fragment = self._fragment(inode['fragment'])
+            chunks.append(fragment[inode['frag_offset']:inode['frag_offset'] + tail])
+        return b''.join(chunks)[:inode['size']]
+
+
+def parse_desktop_entry(text: str) -> dict:
+    """Unlocalized keys of [Desktop Entry] group."""
+    entry, in_group = {}, False
+    for line in text.splitlines():
+        line = line.strip()
+        if line.startswith('['):
+            in_group = line == '[Desktop Entry]'
+            continue
+        if not in_group or '=' not in line or line.startswith('#'):
+            continue
+        key, value = line.split('=', 1)
+        key = key.strip()
+        if '[' not in key:
+            entry[key] = value.strip()
+    return entry
+
+
+def appimage_metadata(path: str) -> dict:
+    """Icon (bytes) and .desktop entry embedded in a type 2 AppImage.
+    Returns empty dictionary if they can't be read."""
+    try:
+        with SquashFS(path) as fs:
+            root = fs.listdir(fs.inode(fs.root_inode))
+            metadata = {}
+
+            desktop = sorted(_ for _ in root if _.endswith('.desktop'))
+            if desktop:
+                metadata['desktop'] = parse_desktop_entry(fs.read(desktop[0]).decode('utf-8', 'replace'))
+
+            # .DirIcon is the AppImage icon, Icon= of desktop entry is next best
+            candidates = ['.DirIcon']
+            icon = metadata.get('desktop', {}).get('Icon')
+            if icon:
+                candidates += [icon] + [f'{icon}{ext}' for ext in ('.png', '.svg')]
+            for name in candidates:
+                if name in root:
+                    try:
+                        metadata['icon'] = fs.read(name)
+                        break
+                    except SquashfsError:
+                        continue
+            return metadata
+    except (OSError, SquashfsError, struct.error, IndexError):
+        return {}
@@ -0,0 +1,241 @@
+"""
+Local store of downloaded AppImages.
+Every finished download is kept once, named by its SHA-256. Later
+downloads of same content (another --path, reinstall after --remove,
+another user on same box) are served from store with a reflink,
+hardlink or copy_file_range instead of network. Store is shrunk to
+max_size, least recently used files first.
+"""
+
+import os
+import json
+import time
+import fcntl
+import errno
+import shutil
+import threading
+
+
+# Can be changed with configure(), values comes from aptod.conf
+settings = {
+    # Default is ~/.cache/aptod/store, can be shared with other users
+    'path': None,
+    # Bytes that only store holds, 0 turns store off
+    'max_size': 4 * 1024 * 1024 * 1024,
+}
+
+# ioctl that makes dst share src's blocks (btrfs, xfs, bcachefs...)
+FICLONE = 0x40049409
+
+
+def configure(**kwargs) -> None:
+    """Updates store settings."""
+    unknown = set(kwargs) - set(settings)
+    if unknown:
+        raise ValueError(f'Unknown store setting(s): {", ".join(unknown)}')
+    settings.update({k: v for k, v in kwargs.items() if v is not None})
+
+
+def _reflink(src: str, dst: str) -> None:
+    with open(src, 'rb') as src_file, open(dst, 'wb') as dst_file:
+        fcntl.ioctl(dst_file.fileno(), FICLONE, src_file.fileno())
+
+
+def _copy_range(src: str, dst: str) -> None:
+    """Copies in kernel, without reading file into python."""
+    with open(src, 'rb') as src_file, open(dst, 'wb') as dst_file:
+        if not hasattr(os, 'copy_file_range'):
+            shutil.copyfileobj(src_file, dst_file, 1024 * 1024)
+            return
+        remaining = os.fstat(src_file.fileno()).st_size
+        while remaining:
+            count = os.copy_file_range(src_file.fileno(), dst_file.fileno(), remaining)
+            if not count:
+                break
+            remaining -= count
+
+
+def clone(src: str, dst: str) -> str:
+    """Makes dst same file with src, cheapest way first. dst is
+    replaced atomically. Returns used method."""
+    tmp_pth = f'{dst}.{os.getpid()}.{threading.get_ident()}.tmp'
+    for method, func in (('reflink', _reflink), ('hardlink', os.link), ('copy', _copy_range)):
+        try:
+            func(src, tmp_pth)
+        except OSError as err:
+            if os.path.exists(tmp_pth):
+                os.remove(tmp_pth)
+            # Real copy is last chance, its errors are real ones
+            if method == 'copy' or err.errno == errno.ENOENT:
+                raise
+            continue
+        os.replace(tmp_pth, dst)
+        return method
+    return ''
+
+
+class DownloadStore:
+    """Content addressed store of downloaded files. Files are found
+    by SHA-256, or by url with size and ETag of its response."""
+
+    _lock = threading.Lock()
+
+    def __init__(self):
+        cache_dir = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+        self.path = settings['path'] or os.path.join(cache_dir, 'aptod', 'store')
+        self.index_pth = os.path.join(self.path, 'index.json')
+
+    @property
+    def enabled(self) -> bool:
+        return settings['max_size'] > 0
+
+    @staticmethod
+    def url_key(url: str, size: int, etag: str = None) -> str:
+        return f'{url}|{size}|{etag or ""}'
+
+    def object_path(self, digest: str) -> str:
+        return os.path.join(self.path, 'objects', digest[:2], digest)
+
+    def _update(self, func):
+        """Runs func(index) with index locked against other
+        processes, and writes index back."""
+        os.makedirs(self.path, exist_ok=True)
+        with self._lock, open(self.index_pth + '.lock', 'w', encoding="utf-8") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                with open(self.index_pth, 'r', encoding="utf-8") as file:
+                    index = json.load(file)
+            except (OSError, json.decoder.JSONDecodeError):
+                index = {}
+            index.setdefault('objects', {})
+            index.setdefault('urls', {})
+
+            result = func(index)
+
+            tmp_pth = self.index_pth + '.tmp'
+            with open(tmp_pth, 'w', encoding="utf-8") as file:
+                json.dump(index, file)
+            os.replace(tmp_pth, self.index_pth)
+            return result
+
+    def _valid(self, index: dict, digest: str) -> bool:
+        """True if object is there and unchanged since it was added,
+        same inode, size and mtime. Hardlinked installs may be written
+        over or replaced, those are dropped."""
+        entry = index['objects'].get(digest)
+        if not entry:
+            return False
+        try:
+            stat = os.stat(self.object_path(digest))
+        except OSError:
+            stat = None
+        if stat and (stat.st_ino, stat.st_size, stat.st_mtime_ns) == (
+                entry.get('ino'), entry['size'], entry['mtime']):
+            return True
+        self._drop(index, digest)
+        return False
+
+    def _drop(self, index: dict, digest: str) -> None:
+        index['objects'].pop(digest, None)
+        for key in [key for key, value in index['urls'].items() if value == digest]:
+            del index['urls'][key]
+        try:
+            os.remove(self.object_path(digest))
+        except OSError:
+            pass
+
+    def lookup(self, sha256: str = None, url_key: str = None) -> str:
+        """Digest of stored file with given digest or url key, or ''."""
+        if not self.enabled or not (sha256 or url_key) or not os.path.exists(self.index_pth):
+            return ''
+
+        def find(index):
+            digest = sha256 or index['urls'].get(url_key)
+            if not digest or not self._valid(index, digest):
+                return ''
+            index['objects'][digest]['used'] = time.time()
+            return digest
+
+        return self._update(find)
+
+    def fetch(self, path: str, sha256: str = None, url_key: str = None, size: int = None) -> str:
+        """Creates path from store if it has the file. Returns
+        digest of it, or '' if store doesn't have it. Lookup checks
+        inode, size and mtime recorded when file was added, so file isn't
+        read again, size must also match the response's if it's given."""
+        digest = self.lookup(sha256, url_key)
+        if not digest:
+            return ''
+        try:
+            if size is not None and os.path.getsize(self.object_path(digest)) != size:
+                return ''
+        except OSError:
+            return ''
+        try:
+            clone(self.object_path(digest), path)
+        except OSError:
+            return ''
+        return digest
+
+    def add(self, path: str, sha256: str, url_key: str = None) -> None:
+        """Keeps downloaded path in store, than shrinks store to max_size.
+        sha256 must be verified with published one, store serves it as is."""
+        if not self.enabled or not sha256:
+            return
+        object_pth = self.object_path(sha256)
+
+        def insert(index):
+            if not self._valid(index, sha256):
+                os.makedirs(os.path.dirname(object_pth), exist_ok=True)
+                clone(path, object_pth)
+                stat = os.stat(object_pth)
+                index['objects'][sha256] = {'ino': stat.st_ino, 'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+            index['objects'][sha256]['used'] = time.time()
+            if url_key:
+                index['urls'][url_key] = sha256
+            self._evict(index)
+
+        try:
+            self._update(insert)
+        except OSError:
+            # Store is only a shortcut, download is done anyway
+            pass
+
+    def _evict(self, index: dict) -> None:
+        """Removes least recently used files until store holds at
+        most max_size. Files still hardlinked to installs take no
+        space of their own, so they are not counted."""
+        own = []
+        for digest, entry in index['objects'].items():
+            try:
+                stat = os.stat(self.object_path(digest))
+            except OSError:
+                continue
+            if stat.st_nlink == 1:
+                own.append((entry.get('used', 0), digest, stat.st_size))
+
+        total = sum(size for _, _, size in own)
+        for _, digest, size in sorted(own):
+            if total <= settings['max_size']:
+                break
+            self._drop(index, digest)
+            total -= size
+
+    def stats(self) -> dict:
+        """File count, total size and size that only store holds."""
+        if not os.path.exists(self.index_pth):
+            return {'files': 0, 'size': 0, 'own_size': 0}
+
+        def count(index):
+            files = size = own = 0
+            for digest in list(index['objects']):
+                if not self._valid(index, digest):
+                    continue
+                stat = os.stat(self.object_path(digest))
+                files += 1
+                size += stat.st_size
+                if stat.st_nlink == 1:
+                    own += stat.st_size
+            return {'files': files, 'size': size, 'own_size': own}
+
+        return self._update(count)
@@ -0,0 +1,104 @@
+"""
+Fast writer for streamed downloads.
+Response is read into one reusable buffer with a chunk size that
+follows measured throughput, buffer is written with one positional
+write per chunk and progress is reported a few times per second.
+"""
+
+import os
+import time
+import errno
+
+
+MIN_CHUNK = 64 * 1024
+MAX_CHUNK = 4 * 1024 * 1024
+# Chunk size is changed to keep each read about this long
+TARGET_READ_SECONDS = (0.05, 0.25)
+PROGRESS_INTERVAL = 0.1
+CHECKPOINT_INTERVAL = 1.0
+
+
+def preallocate(fd: int, offset: int, length: int) -> None:
+    """Reserves disk space for length bytes after offset, so a full
+    disk fails before download starts. Not supported filesystems
+    are ignored."""
+    if length <= 0 or not hasattr(os, 'posix_fallocate'):
+        return
+    try:
+        os.posix_fallocate(fd, offset, length)
+    except OSError as err:
+        if err.errno in (errno.EOPNOTSUPP, errno.EINVAL, errno.ENOSYS):
+            return
+        raise
+
+
+def next_chunk_size(size: int, seconds: float) -> int:
+    """Doubles chunk size for fast reads, halves it for slow ones."""
+    if seconds < TARGET_READ_SECONDS[0]:
+        return min(size * 2, MAX_CHUNK)
+    if seconds > TARGET_READ_SECONDS[1]:
+        return max(size // 2, MIN_CHUNK)
+    return size
+
+
+class StreamWriter:
+    """Writes streamed requests responses into fd from offset.
+    hasher is updated with written bytes, on_progress(written) is called
+    at most every PROGRESS_INTERVAL and once at the end, on_checkpoint(pos)
+    about every second. written is kept up to date, so caller knows
+    how much is on disk if download breaks."""
+
+    def __init__(self, fd: int, offset: int = 0, hasher=None, on_progress=None, on_checkpoint=None):
+        self.fd = fd
+        self.offset = offset
+        self.hasher = hasher
+        self.on_progress = on_progress
+        self.on_checkpoint = on_checkpoint
+        self.written = 0
+        self.buffer = bytearray(MAX_CHUNK)
+
+    def write_from(self, res, length: int) -> int:
+        """Writes at most length bytes of res body, returns written byte count."""
+        raw = res.raw
+        # Same as iter_content, gzip encoded bodies are decoded
+        raw.decode_content = True
+
+        view = memoryview(self.buffer)
+        size = MIN_CHUNK
+        last_progress = last_checkpoint = time.monotonic()
+
+        while self.written < length:
+            want = min(size, length - self.written)
+            start = time.monotonic()
+            # Fill the chunk, reads may return less than asked
+            filled = 0
+            while filled < want:
+                count = raw.readinto(view[filled:want])
+                if not count:
+                    break
+                filled += count
+            if not filled:
+                break
+
+            chunk = view[:filled]
+            os.pwrite(self.fd, chunk, self.offset + self.written)
+            if self.hasher is not None:
+                self.hasher.update(chunk)
+            self.written += filled
+
+            now = time.monotonic()
+            size = next_chunk_size(size, now - start)
+            if self.on_progress and now - last_progress >= PROGRESS_INTERVAL:
+                self.on_progress(self.written)
+                last_progress = now
+            if self.on_checkpoint and now - last_checkpoint >= CHECKPOINT_INTERVAL:
+                self.on_checkpoint(self.offset + self.written)
+                last_checkpoint = now
+
+            # Body ended before length
+            if filled < want:
+                break
+
+        if self.on_progress:
+            self.on_progress(self.written)
+        return self.written
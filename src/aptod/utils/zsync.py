@@ -0,0 +1,273 @@
+"""
+zsync delta downloads for AppImage updates.
+New version is built from blocks of the installed AppImage
+that still exists in new version, only missing byte ranges
+are downloaded. Format of .zsync files is described at
+http://zsync.moria.org.uk/
+"""
+
+import os
+import mmap
+import struct
+import time
+import hashlib
+import itertools
+from urllib.parse import urljoin
+
+from . import http_client, checksum
+
+
+# Seconds spent for finding blocks in seed, rest of file is downloaded
+MATCH_TIME = 20
+# Gaps smaller than this are downloaded too, instead of extra requests
+MERGE_GAP = 64 * 1024
+
+
+def _md4_py(data: bytes) -> bytes:
+    """Pure python MD4, OpenSSL 3 builds of hashlib do not have it.
+    It's too slow for real files, delta updates are skipped without
+    FAST_MD4. Kept so module works anyway."""
+    def rol(x, n):
+        x &= 0xffffffff
+        return ((x << n) | (x >> (32 - n))) & 0xffffffff
+
+    msg = bytearray(data)
+    bit_len = (8 * len(data)) & 0xffffffffffffffff
+    msg.append(0x80)
+    msg.extend(b'\x00' * ((56 - len(msg) % 64) % 64))
+    msg.extend(struct.pack('<Q', bit_len))
+
+    h = [0x67452301, 0xefcdab89, 0x98badcfe, 0x10325476]
+    for chunk in range(0, len(msg), 64):
+        x = struct.unpack('<16I', msg[chunk:chunk + 64])
+        a, b, c, d = h
+
+        for i in range(16):
+            k = i
+            s = (3, 7, 11, 19)[i % 4]
+            a, b, c, d = d, rol(a + ((b & c) | (~b & d)) + x[k], s), b, c
+        for i in range(16):
+            k = (i % 4) * 4 + i // 4
+            s = (3, 5, 9, 13)[i % 4]
+            a, b, c, d = d, rol(a + ((b & c) | (b & d) | (c & d)) + x[k] + 0x5a827999, s), b, c
+        for i in range(16):
+            k = (0, 8, 4, 12, 2, 10, 6, 14, 1, 9, 5, 13, 3, 11, 7, 15)[i]
+            s = (3, 9, 11, 15)[i % 4]
+            a, b, c, d = d, rol(a + (b ^ c ^ d) + x[k] + 0x6ed9eba1, s), b, c
+
+        h = [(v + n) & 0xffffffff for v, n in zip(h, (a, b, c, d))]
+
+    return struct.pack('<4I', *h)
+
+
+def _has_fast_md4() -> bool:
+    try:
+        hashlib.new('md4')
+    except ValueError:
+        return False
+    return True
+
+
+FAST_MD4 = _has_fast_md4()
+
+
+def md4(data: bytes) -> bytes:
+    """MD4 digest of data."""
+    if FAST_MD4:
+        return hashlib.new('md4', data).digest()
+    return _md4_py(data)
+
+
+def rsum(block) -> tuple:
+    """zsync rolling checksum (a, b) of block."""
+    # accumulate and sum works in C, much faster than python loop
+    return sum(block) & 0xffff, sum(itertools.accumulate(block)) & 0xffff
+
+
+def parse_control(content: bytes) -> dict:
+    """Parses .zsync file content."""
+    header_end = content.index(b'\n\n')
+    header = {}
+    for line in content[:header_end].decode('utf-8', 'replace').splitlines():
+        key, _, value = line.partition(':')
+        header[key.strip().lower()] = value.strip()
+
+    blocksize = int(header['blocksize'])
+    length = int(header['length'])
+    seq_matches, rsum_bytes, checksum_bytes = (int(_) for _ in header.get('hash-lengths', '1,4,16').split(','))
+    count = -(-length // blocksize)
+
+    entry = rsum_bytes + checksum_bytes
+    body = content[header_end + 2:]
+    if len(body) < count * entry:
+        raise ValueError('zsync file is truncated.')
+
+    blocks = [
+        (int.from_bytes(body[i * entry:i * entry + rsum_bytes], 'big'),
+         body[i * entry + rsum_bytes:(i + 1) * entry])
+        for i in range(count)
+    ]
+
+    return {
+        'url': header.get('url'),
+        'sha1': header.get('sha-1', '').lower(),
+        'blocksize': blocksize,
+        'length': length,
+        'checksum_bytes': checksum_bytes,
+        'seq_matches': seq_matches,
+        # Only stored bytes of rsum are compared
+        'a_mask': 0xffff if rsum_bytes >= 4 else (0xff if rsum_bytes == 3 else 0),
+        'blocks': blocks,
+    }
+
+
+def match_blocks(seed, control: dict, deadline: float = None) -> dict:
+    """Finds target blocks that exists in seed data.
+    Returns target block index -> seed offset. Every rsum hit is
+    confirmed with block's MD4 (after next block's rsum, if .zsync
+    asks for sequential matches). Matching stops at deadline, blocks
+    not found until then are downloaded."""
+
+    size = control['blocksize']
+    a_mask = control['a_mask']
+    checksum_bytes = control['checksum_bytes']
+    seq_matches = control['seq_matches']
+    blocks = control['blocks']
+    if deadline is None:
+        deadline = time.monotonic() + MATCH_TIME
+
+    wanted: dict = {}
+    for index, (key, strong) in enumerate(blocks):
+        wanted.setdefault(key, {}).setdefault(strong, []).append(index)
+
+    found: dict = {}
+
+    def next_matches(offset, candidates) -> bool:
+        """Next seed block has rsum of a candidate's next block,
+        like zsync's seq_matches. Cheap filter before MD4."""
+        if offset + 2 * size > len(seed):
+            return True
+        a, b = rsum(seed[offset + size:offset + 2 * size])
+        next_key = ((a & a_mask) << 16) | b
+        return any(i + 1 == len(blocks) or blocks[i + 1][0] == next_key
+                   for group in candidates.values() for i in group)
+
+    def check(offset, a, b) -> bool:
+        key = ((a & a_mask) << 16) | b
+        candidates = wanted.get(key)
+        if not candidates:
+            return False
+        if seq_matches > 1 and not next_matches(offset, candidates):
+            return False
+        indexes = candidates.pop(md4(seed[offset:offset + size])[:checksum_bytes], None)
+        if not indexes:
+            return False
+        if not candidates:
+            del wanted[key]
+        for index in indexes:
+            found[index] = offset
+        return True
+
+    last_pos = len(seed) - size
+    pos = 0
+    while pos <= last_pos and wanted and time.monotonic() < deadline:
+        a, b = rsum(seed[pos:pos + size])
+        if check(pos, a, b):
+            pos += size
+            continue
+
+        # Data shifted after a changed part, roll one block forward to resync
+        start = pos
+        limit = min(last_pos, pos + size)
+        matched = False
+        while pos < limit:
+            out, new = seed[pos], seed[pos + size]
+            a = (a - out + new) & 0xffff
+            b = (b - size * out + a) & 0xffff
+            pos += 1
+            if check(pos, a, b):
+                matched = True
+                break
+
+        pos = pos + size if matched else start + size
+
+    return found
+
+
+def _missing_ranges(found: dict, control: dict) -> list:
+    """Byte ranges (start, end) of blocks that are not found."""
+    size = control['blocksize']
+    length = control['length']
+    ranges = []
+    for index in range(len(control['blocks'])):
+        if index in found:
+            continue
+        start, end = index * size, min((index + 1) * size, length) - 1
+        if ranges and start - ranges[-1][1] - 1 <= MERGE_GAP:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((start, end))
+    return ranges
+
+
+def delta_download(zsync_url: str, seed_path: str, path: str, timeout=5, expected_sha256: str = '') -> dict:
+    """Builds file of zsync_url at path, by reusing seed_path blocks
+    and downloading missing ranges. Returns length, downloaded and
+    reused byte counts and SHA-256 of file. Raises if result doesn't
+    match checksums, path is never left broken."""
+
+    res = http_client.get(zsync_url, timeout=timeout)
+    res.raise_for_status()
+    control = parse_control(res.content)
+    down_url = urljoin(zsync_url, control['url'])
+    size, length = control['blocksize'], control['length']
+
+    path_part = path + '.part'
+    downloaded = 0
+    # A new file, truncating a hardlinked one would change its other names too
+    if os.path.exists(path_part):
+        os.remove(path_part)
+    fd = os.open(path_part, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o644)
+    try:
+        os.ftruncate(fd, length)
+
+        with open(seed_path, 'rb') as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as seed:
+                found = match_blocks(seed, control)
+                for index, offset in found.items():
+                    os.pwrite(fd, seed[offset:offset + min(size, length - index * size)], index * size)
+
+        for start, end in _missing_ranges(found, control):
+            res = http_client.get(
+                down_url, stream=True, timeout=timeout,
+                headers={'Range': f'bytes={start}-{end}'})
+            res.raise_for_status()
+            if res.status_code != 206:
+                res.close()
+                raise ValueError(f'Server ignored range request for {down_url}')
+            with res:
+                for chunk in res.iter_content(chunk_size=256 * 1024):
+                    chunk = chunk[:end + 1 - start]
+                    os.pwrite(fd, chunk, start)
+                    start += len(chunk)
+                    downloaded += len(chunk)
+            if start != end + 1:
+                raise ValueError(f'Range download of {down_url} is incomplete.')
+
+        # Blocks are written out of order, checksums needs one read
+        sha1, sha256 = hashlib.sha1(), hashlib.sha256()
+        os.lseek(fd, 0, os.SEEK_SET)
+        for chunk in iter(lambda: os.read(fd, 1024 * 1024), b''):
+            sha1.update(chunk)
+            sha256.update(chunk)
+        if control['sha1'] and sha1.hexdigest() != control['sha1']:
+            raise ValueError('Delta update checksum mismatch.')
+        digest = checksum.verify(sha256, expected_sha256, path_part)
+    except BaseException:
+        os.close(fd)
+        os.remove(path_part)
+        raise
+
+    os.close(fd)
+    os.rename(path_part, path)
+    return {'length': length, 'downloaded': downloaded, 'reused': length - downloaded, 'sha256': digest}
@@ -0,0 +1,191 @@
+"""
+Watch mode of Aptod.
+Runs as a long living process (exmp. systemd user service), checks
+each installed app when its own time comes and optionally updates it.
+Next check of an app follows how often that app releases, with
+jitter, and schedule is kept on disk so restarts don't check all
+apps at once.
+"""
+
+import os
+import json
+import time
+import random
+import signal
+import socket
+import threading
+
+from .file_suite import FileSuite, DesktopBatch
+from .cache_suite import CacheSuite
+from .rate_limit_suite import BACKGROUND
+
+
+MIN_INTERVAL = 3600
+MAX_INTERVAL = 7 * 86400
+DEFAULT_INTERVAL = 6 * 3600
+RETRY_INTERVAL = 3600
+JITTER = 0.1
+# Longest sleep, so new installs and removals are noticed
+MAX_SLEEP = 900
+
+
+def jittered(seconds: float) -> float:
+    """seconds +/- JITTER, spreads checks of many apps and machines."""
+    return seconds * random.uniform(1 - JITTER, 1 + JITTER)
+
+
+def next_interval(entry: dict, changed: bool, now: float) -> float:
+    """Time until next check of app, from times its new
+    releases were seen. Without history, interval grows while
+    nothing changes and shrinks when something does."""
+    if changed:
+        entry['changes'] = (entry.get('changes', []) + [now])[-6:]
+
+    changes = entry.get('changes', [])
+    if len(changes) >= 2:
+        gaps = sorted(b - a for a, b in zip(changes, changes[1:]))
+        # Quiet apps get checked less, a few checks per release gap is enough
+        interval = max(gaps[len(gaps) // 2], now - changes[-1]) / 4
+    elif changed:
+        interval = entry.get('interval', DEFAULT_INTERVAL) / 2
+    else:
+        interval = entry.get('interval', DEFAULT_INTERVAL) * 1.5
+    return min(max(interval, MIN_INTERVAL), MAX_INTERVAL)
+
+
+def sd_notify(message: str) -> None:
+    """Tells systemd about service state, if it's started
+    as a Type=notify service. Otherwise does nothing."""
+    address = os.environ.get('NOTIFY_SOCKET')
+    if not address:
+        return
+    if address.startswith('@'):
+        address = '\0' + address[1:]
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.connect(address)
+            sock.sendall(message.encode())
+    except OSError:
+        pass
+
+
+class WatchSuite:
+    """Checks installed apps on their own schedule."""
+
+    def __init__(self, aptod, jobs: int = 4, auto_update: bool = False):
+        # One Aptod for whole run, keeps registry, caches and sessions warm
+        self.aptod = aptod
+        self.jobs = jobs
+        self.auto_update = auto_update
+        self.schedule_pth = os.path.join(FileSuite().cfg_dir, 'watch_schedule.json')
+        self.schedule = self._load()
+        self.stop = threading.Event()
+
+    def _load(self) -> dict:
+        try:
+            with open(self.schedule_pth, 'r', encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, json.decoder.JSONDecodeError):
+            return {}
+
+    def _save(self) -> None:
+        tmp_pth = self.schedule_pth + '.tmp'
+        with open(tmp_pth, 'w', encoding="utf-8") as file:
+            json.dump(self.schedule, file, indent=2)
+        os.replace(tmp_pth, self.schedule_pth)
+
+    @staticmethod
+    def log(message: str) -> None:
+        print(f"{time.strftime('%Y-%m-%d %H:%M:%S')} {message}", flush=True)
+
+    def _sync(self, installed: dict, now: float) -> None:
+        """Adds new installed apps to schedule, removes uninstalled ones."""
+        for app in list(self.schedule):
+            if app not in installed:
+                del self.schedule[app]
+        for app in installed:
+            if app not in self.schedule:
+                # Spread first checks, no burst after first start
+                self.schedule[app] = {
+                    'next_check': now + random.uniform(0, MIN_INTERVAL),
+                    'interval': DEFAULT_INTERVAL,
+                }
+
+    def run_once(self, now: float = None) -> float:
+        """Checks apps whose time has come. Returns seconds until next check."""
+        now = now or time.time()
+        installed = self.aptod.installed_apps()
+        self._sync(installed, now)
+
+        due = [app for app, entry in self.schedule.items() if entry['next_check'] <= now]
+        if due:
+            extractor = self.aptod.update_suite.extractor
+            # Last round's answers must not be reused
+            extractor.prefetched.clear()
+            results = self.aptod.check_updates(due, installed, self.jobs, BACKGROUND)
+            with DesktopBatch() as batch:
+                for app, app_data in results.items():
+                    self._handle(app, app_data, installed, now, batch)
+            self._save()
+            CacheSuite().save()
+
+        if not self.schedule:
+            return MAX_SLEEP
+        return max(0.0, min(entry['next_check'] for entry in self.schedule.values()) - time.time())
+
+    def _handle(self, app: str, app_data: dict, installed: dict, now: float,
+                batch: DesktopBatch = None) -> None:
+        """Schedules next check of app from its check result."""
+        entry = self.schedule[app]
+        entry['last_check'] = now
+
+        if app_data.get('Postponed'):
+            entry['next_check'] = app_data['Postponed'] + random.uniform(0, 300)
+            self.log(f"{app}: {app_data['Error']}")
+            return
+        if app_data.get('Error'):
+            entry['next_check'] = now + jittered(RETRY_INTERVAL)
+            self.log(f"{app}: {app_data['Error']}")
+            return
+
+        # Up to date apps return nothing, latest version comes from stored release
+        release, _ = CacheSuite().get_release(app)
+        version = (release or {}).get('version') or (release or {}).get('name')
+        changed = bool(entry.get('version')) and version != entry['version']
+        entry['version'] = version
+        entry['interval'] = next_interval(entry, changed, now)
+        entry['next_check'] = now + jittered(entry['interval'])
+
+        if not app_data:
+            return
+        if not self.auto_update:
+            self.log(f'{app}: new version {version} is available.')
+            return
+        try:
+            self.aptod.apply_update(app, app_data, installed, batch)
+            self.log(f'{app}: updated to {version}.')
+        except Exception as err:
+            entry['next_check'] = now + jittered(RETRY_INTERVAL)
+            self.log(f'{app}: update failed, {err}')
+
+    def run(self) -> None:
+        """Runs until SIGTERM or SIGINT."""
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, lambda *args: self.stop.set())
+
+        self.log(f"Watching {len(self.aptod.installed_apps())} apps"
+                 f"{', updates are applied automatically' if self.auto_update else ''}.")
+        sd_notify('READY=1')
+        while not self.stop.is_set():
+            try:
+                wait = self.run_once()
+            except Exception as err:
+                # Service keeps running, network or disk may come back
+                self.log(f'Check round failed, {err}')
+                wait = MAX_SLEEP
+            sd_notify(f'STATUS=Next check in {int(wait)} s')
+            self.stop.wait(min(wait, MAX_SLEEP))
+
+        self._save()
+        sd_notify('STOPPING=1')
+        self.log('Stopped.')